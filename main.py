@@ -1,7 +1,22 @@
+import uuid
+
 import streamlit as st
+from models.config import WARMUP_MODELS, PROFILE_NAMES, DEFAULT_PROFILE, DEDUP_NEAR, EARLY_STOP
+from models.registry import warm_up, model_stats
+from models.cache import result_cache
+from models.jobs import job_manager
+from models.cascade import cascade_stats
+from models.history import history_store
+from models.tracing import recent_traces, trace
 
 st.set_page_config(layout="wide", page_title="Bio Scan", page_icon="🧬")
 
+# Scopes detection jobs to this browser session (see models.jobs.job_key)
+st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+if WARMUP_MODELS:
+    warm_up(WARMUP_MODELS)
+
 
 pg = st.navigation({
     "BioScan": [
@@ -10,7 +25,8 @@ pg = st.navigation({
     "Cells":    [
         st.Page("./pages/cells_detection_page.py", title="Cells Detection"),
         st.Page("./pages/malarial_detection_page.py",
-                title="Malarial Detection")
+                title="Malarial Detection"),
+        st.Page("./pages/smear_analysis_page.py", title="Smear Analysis")
     ],
     "Cancer": [
         st.Page("./pages/breast_cancer_detection_page.py",
@@ -19,4 +35,63 @@ pg = st.navigation({
 },
     position="sidebar"
 )
-pg.run()
+
+st.sidebar.selectbox("Inference profile", PROFILE_NAMES, index=PROFILE_NAMES.index(DEFAULT_PROFILE),
+                     key="inference_profile", help="'default' matches training settings, 'fast' trades accuracy for speed.")
+st.sidebar.toggle("Skip near-duplicate images", value=DEDUP_NEAR, key="dedup_near",
+                  help="Also treat re-encoded or resized copies of an image as duplicates. Byte-identical uploads are always analyzed once.")
+st.sidebar.toggle("Count duplicates in totals", value=False, key="count_duplicates",
+                  help="Count every uploaded copy in the cell totals instead of each distinct image once.")
+st.sidebar.text_input("Sample / patient ID", key="sample_id",
+                      help="Analyses are added to this sample's running totals in the history store.")
+st.sidebar.toggle("Stop early when settled", value=EARLY_STOP, key="early_stop",
+                  help="Stop analyzing further images once the confidence interval of the infection share or RBC/WBC ratio is narrow enough.")
+
+with st.sidebar.expander("Model status", expanded=False):
+    stats = model_stats()
+    if stats:
+        st.dataframe([{"Model": name, **values}
+                     for name, values in stats.items()], hide_index=True)
+    else:
+        st.caption("No models loaded yet.")
+    cache_stats = result_cache.stats()
+    st.caption(
+        f"Result cache: {cache_stats['entries']}/{cache_stats['max_entries']} entries, "
+        f"{cache_stats['hits'] + cache_stats['disk_hits']} hits, {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%} hit rate)")
+    job_stats = job_manager.stats()
+    st.caption(
+        f"Jobs: {job_stats['running']} running, {job_stats['queued']} queued, {job_stats['done']} done")
+    history = history_store.stats()
+    if history["path"]:
+        st.caption(
+            f"History: {history['analyses']} analyses, {history['samples']} samples, "
+            f"{history['hits']} reused")
+    for model_id, cascade in cascade_stats().items():
+        st.caption(
+            f"Cascade {model_id}: {cascade['escalated']}/{cascade['images']} images escalated "
+            f"({cascade['escalated_fraction']:.0%})")
+
+
+def show_trace(trace, spans=False):
+    running = " (running)" if trace.seconds is None else f" in {trace.seconds * 1000:,.0f} ms"
+    st.caption(f"**{trace.name}**{running}")
+    st.dataframe(trace.stages(), hide_index=True)
+    if spans:
+        st.dataframe(trace.to_dict()["spans"], hide_index=True)
+    if trace.profile:
+        st.code(trace.profile)
+
+
+# Stage timings of the previous page run and the latest detection jobs
+if st.sidebar.toggle("Debug timings", key="debug_timings"):
+    with st.sidebar.expander("Timings", expanded=True):
+        page_traces = recent_traces("page")
+        if page_traces:
+            show_trace(page_traces[0])
+        running = [job.trace for job in job_manager.running() if job.trace is not None]
+        for job_trace in (running or recent_traces("job"))[:3]:
+            show_trace(job_trace, spans=True)
+
+with trace(f"page {pg.title}"):
+    pg.run()
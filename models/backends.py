@@ -0,0 +1,314 @@
+import os
+import warnings
+
+import numpy as np
+
+from models.config import (BACKENDS, BREAST_CANCER_DATASET, CALIBRATION_IMAGES,
+                           DATASET_YAMLS, INT8, MODEL_PATHS, MODEL_TASKS, MODEL_VARIANTS,
+                           PROFILES, TRAIN_IMGSZ)
+
+DETECTOR_BACKENDS = ("pytorch", "onnx", "openvino")
+ANN_BACKENDS = ("numpy", "keras", "onnx", "openvino")
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "tanh": np.tanh,
+}
+
+
+def base_model(name):
+    return MODEL_VARIANTS[name]["base"] if name in MODEL_VARIANTS else name
+
+
+def source_path(name):
+    return MODEL_VARIANTS[name]["path"] if name in MODEL_VARIANTS else MODEL_PATHS[name]
+
+
+def _ann_backend(backend):
+    # Without its exported weights the NumPy ANN falls back to the Keras model
+    if backend == "numpy" and not os.path.exists(artifact_path("breast_cancer_ann", "numpy")):
+        return "keras"
+    return backend
+
+
+def backend_label(name, backend=None, int8=None):
+    backend = backend or BACKENDS[base_model(name)]
+    if base_model(name) not in MODEL_TASKS:
+        backend = _ann_backend(backend)
+    int8 = INT8 if int8 is None else int8
+    native = backend in ("pytorch", "keras", "numpy")
+    return backend if native or not int8 else f"{backend}-int8"
+
+
+def artifact_path(name, backend=None, int8=None):
+    backend = backend or BACKENDS[base_model(name)]
+    int8 = INT8 if int8 is None else int8
+    allowed = DETECTOR_BACKENDS if base_model(name) in MODEL_TASKS else ANN_BACKENDS
+    if backend not in allowed:
+        raise ValueError(
+            f"Unknown backend {backend!r} for {name}, expected one of {', '.join(allowed)}")
+
+    source = source_path(name)
+    if backend in ("pytorch", "keras"):
+        return source
+    if backend == "numpy":
+        return os.path.splitext(source)[0] + ".npz"
+    # Ultralytics names its exports <stem>.onnx and <stem>_openvino_model/,
+    # with an _int8 suffix on the stem for quantized OpenVINO models.
+    stem = os.path.splitext(source)[0] + ("_int8" if int8 else "")
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if base_model(name) in MODEL_TASKS:
+        return f"{stem}_openvino_model"
+    return f"{stem}_openvino.xml"
+
+
+def _require(path, name, backend, int8):
+    if not os.path.exists(path):
+        flags = f" --backend {backend}" + (" --int8" if int8 else "")
+        raise FileNotFoundError(
+            f"{path} not found; build it with `python -m scripts.export_models {name}{flags}`")
+
+
+def load_detector(name, backend=None, int8=None):
+    from ultralytics import YOLO
+
+    backend = backend or BACKENDS[base_model(name)]
+    int8 = INT8 if int8 is None else int8
+    path = artifact_path(name, backend, int8)
+    if backend != "pytorch":
+        _require(path, name, backend, int8)
+    return YOLO(path, task=MODEL_TASKS[base_model(name)])
+
+
+class NumpyANN:
+    # Dense layers exported from the Keras model; the breast cancer ANN is a
+    # 30-6-6-1 stack, far too small to be worth a TensorFlow import.
+    def __init__(self, path):
+        with np.load(path) as f:
+            self.activations = [str(a) for a in f["activations"]]
+            self.layers = [(f[f"kernel_{i}"].astype(np.float32), f[f"bias_{i}"].astype(np.float32))
+                           for i in range(len(self.activations))]
+        unknown = sorted(set(self.activations) - set(_ACTIVATIONS))
+        if unknown:
+            raise ValueError(f"Unsupported activation(s) in {path}: {', '.join(unknown)}")
+
+    def __call__(self, X, training=False):
+        X = np.asarray(X, dtype=np.float32)
+        for (kernel, bias), activation in zip(self.layers, self.activations):
+            X = _ACTIVATIONS[activation](X @ kernel + bias)
+        return X
+
+
+class OnnxANN:
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        self.session = ort.InferenceSession(
+            path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, X, training=False):
+        return self.session.run(None, {self.input_name: X})[0]
+
+
+class OpenVINOANN:
+    def __init__(self, path):
+        import openvino as ov
+
+        self.model = ov.Core().compile_model(path, "CPU")
+
+    def __call__(self, X, training=False):
+        return self.model(X)[0]
+
+
+def load_ann(backend=None, int8=None):
+    backend = backend or BACKENDS["breast_cancer_ann"]
+    int8 = INT8 if int8 is None else int8
+    if _ann_backend(backend) != backend:
+        # The NumPy weights are exported ahead of time, never on the request
+        # path; until then the app keeps working on the Keras model
+        warnings.warn(f"{artifact_path('breast_cancer_ann', backend)} not found, using the Keras "
+                      f"model; export it with `python -m scripts.export_models breast_cancer_ann "
+                      f"--backend numpy` to serve without TensorFlow")
+        backend = "keras"
+    path = artifact_path("breast_cancer_ann", backend, int8)
+    if backend == "keras":
+        import tensorflow as tf
+        return tf.keras.models.load_model(path)
+    if backend == "numpy":
+        return NumpyANN(path)
+
+    _require(path, "breast_cancer_ann", backend, int8)
+    if backend == "onnx":
+        return OnnxANN(path)
+    return OpenVINOANN(path)
+
+
+def dataset_images(data_yaml, split="val", limit=CALIBRATION_IMAGES):
+    from models.datasets import split_dir, split_images
+
+    directory = split_dir(data_yaml, split) or split_dir(data_yaml, "val")
+    return split_images(directory)[:limit]
+
+
+def _calibration_batches(data_yaml, imgsz, limit=CALIBRATION_IMAGES):
+    from models.ingest import decode_image, letterbox, to_input_tensor
+
+    for path in dataset_images(data_yaml, "val", limit):
+        yield to_input_tensor([letterbox(decode_image(path), imgsz)[0]])
+
+
+def _feature_batches(limit=CALIBRATION_IMAGES, batch_size=64):
+    from models.breast_cancer_model import load_scaler, read_feature_table, validate_features
+
+    mean, scale = load_scaler()
+    X = validate_features(read_feature_table(BREAST_CANCER_DATASET))[:limit]
+    X = ((X - mean) / scale).astype(np.float32)
+    for start in range(0, len(X), batch_size):
+        yield X[start:start + batch_size]
+
+
+def quantize_onnx(src, dst, batches):
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat,
+                                          QuantType, quantize_static)
+
+    input_name = ort.InferenceSession(
+        src, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = iter(batches)
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {input_name: batch}
+
+    quantize_static(src, dst, _Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8, per_channel=True)
+    return dst
+
+
+def export_detector(name, backend, int8=False, data=None, imgsz=None):
+    from ultralytics import YOLO
+
+    model = YOLO(source_path(name))
+    imgsz = imgsz or TRAIN_IMGSZ[base_model(name)]
+    data = data or DATASET_YAMLS[base_model(name)]
+    if backend == "openvino":
+        # Ultralytics calibrates OpenVINO INT8 through NNCF on `data`
+        return model.export(format="openvino", imgsz=imgsz, dynamic=True,
+                            int8=int8, data=data)
+
+    path = model.export(format="onnx", imgsz=imgsz, dynamic=True,
+                        simplify=True)
+    if not int8:
+        return path
+    return quantize_onnx(path, artifact_path(name, "onnx", True),
+                         _calibration_batches(data, imgsz))
+
+
+def export_numpy_ann():
+    import tensorflow as tf
+
+    ann = tf.keras.models.load_model(MODEL_PATHS["breast_cancer_ann"])
+    arrays = {}
+    activations = []
+    for layer in ann.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue  # InputLayer, Dropout
+        if not isinstance(layer, tf.keras.layers.Dense):
+            raise ValueError(f"Cannot export {type(layer).__name__} layer {layer.name} to NumPy")
+        i = len(activations)
+        arrays[f"kernel_{i}"] = weights[0]
+        arrays[f"bias_{i}"] = weights[1] if len(weights) > 1 else np.zeros(weights[0].shape[1])
+        activations.append(layer.get_config()["activation"])
+
+    path = artifact_path("breast_cancer_ann", "numpy")
+    np.savez(path, activations=np.array(activations), **arrays)
+    return path
+
+
+def export_ann(backend, int8=False):
+    if backend == "numpy":
+        return export_numpy_ann()
+
+    import tensorflow as tf
+    import tf2onnx
+    from models.breast_cancer_model import FEATURE_COLUMNS
+
+    ann = tf.keras.models.load_model(MODEL_PATHS["breast_cancer_ann"])
+    path = artifact_path("breast_cancer_ann", "onnx", False)
+    signature = [tf.TensorSpec([None, len(FEATURE_COLUMNS)], tf.float32,
+                               name="features")]
+    tf2onnx.convert.from_keras(ann, input_signature=signature,
+                               output_path=path)
+    if int8:
+        path = quantize_onnx(path, artifact_path("breast_cancer_ann", "onnx", True),
+                             _feature_batches())
+    if backend == "openvino":
+        import openvino as ov
+
+        out_path = artifact_path("breast_cancer_ann", "openvino", int8)
+        ov.save_model(ov.convert_model(path), out_path)
+        return out_path
+    return path
+
+
+def export(name, backend, int8=False, data=None):
+    artifact_path(name, backend, int8)  # validates the backend name
+    if base_model(name) in MODEL_TASKS:
+        return export_detector(name, backend, int8, data)
+    return export_ann(backend, int8)
+
+
+def check_drift(name, backend, int8=False, limit=CALIBRATION_IMAGES):
+    if base_model(name) not in MODEL_TASKS:
+        return _ann_drift(backend, int8, limit)
+
+    from models.records import Detections
+
+    baseline = load_detector(name, "pytorch")
+    candidate = load_detector(name, backend, int8)
+    params = {k: v for k, v in PROFILES[base_model(name)]["default"].items() if k != "half"}
+
+    count_diff = []
+    conf_diff = []
+    for path in dataset_images(DATASET_YAMLS[base_model(name)], "val", limit):
+        a = Detections.from_result(path, baseline.predict(path, verbose=False, **params)[0])
+        b = Detections.from_result(path, candidate.predict(path, verbose=False, **params)[0])
+        n = max(a.counts().size, b.counts().size)
+        count_diff.append(int(np.abs(a.counts(n) - b.counts(n)).sum()))
+        if len(a) and len(b):
+            conf_diff.append(abs(float(a.conf.mean()) - float(b.conf.mean())))
+
+    count_diff = np.asarray(count_diff)
+    return {
+        "model": name,
+        "backend": backend_label(name, backend, int8),
+        "images": int(count_diff.size),
+        "mean_abs_count_diff": float(count_diff.mean()) if count_diff.size else 0.0,
+        "exact_count_match": float((count_diff == 0).mean()) if count_diff.size else 1.0,
+        "mean_conf_diff": float(np.mean(conf_diff)) if conf_diff else 0.0,
+    }
+
+
+def _ann_drift(backend, int8, limit):
+    baseline = load_ann("keras")
+    candidate = load_ann(backend, int8)
+
+    X = np.concatenate(list(_feature_batches(limit)))
+    a = np.asarray(baseline(X, training=False)).reshape(-1)
+    b = np.asarray(candidate(X, training=False)).reshape(-1)
+    return {
+        "model": "breast_cancer_ann",
+        "backend": backend_label("breast_cancer_ann", backend, int8),
+        "rows": int(X.shape[0]),
+        "max_abs_prob_diff": float(np.abs(a - b).max()) if X.size else 0.0,
+        "label_agreement": float(((a > 0.5) == (b > 0.5)).mean()) if X.size else 1.0,
+    }
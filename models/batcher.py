@@ -0,0 +1,90 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from models.config import SERVICE_MAX_BATCH, SERVICE_MAX_WAIT_MS, SERVICE_QUEUE_SIZE
+
+
+class BatcherFull(RuntimeError):
+    pass
+
+
+class MicroBatcher:
+    # Collects items submitted from many threads into batches for one worker
+    # thread: fn(items) -> outputs of the same length. A lone request runs
+    # straight away; once requests start arriving while a batch is running
+    # the worker holds each batch open for up to max_wait_ms to fill it.
+    def __init__(self, fn, max_batch=SERVICE_MAX_BATCH, max_wait_ms=SERVICE_MAX_WAIT_MS,
+                 queue_size=SERVICE_QUEUE_SIZE, name="bioscan-batcher"):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "rejected": 0, "batches": 0,
+                          "failed_batches": 0, "failed_items": 0, "items": 0, "busy_seconds": 0.0}
+        self._last_size = 0
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise BatcherFull(f"{self._queue.maxsize} requests already waiting")
+        with self._lock:
+            self._counters["requests"] += 1
+        return future
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["mean_batch_size"] = round(stats["items"] / stats["batches"], 2) \
+            if stats["batches"] else 0.0
+        return stats
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + (self.max_wait if self._last_size > 1 else 0)
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, batch):
+        try:
+            outputs = self.fn([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # One bad item must not fail the requests that happened to
+                # share its batch: retry them one at a time
+                return sum(self._run([entry]) for entry in batch)
+            batch[0][1].set_exception(e)
+            return 1
+        for (_, future), output in zip(batch, outputs):
+            future.set_result(output)
+        return 0
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            self._last_size = len(batch)
+            start = time.perf_counter()
+            failed = self._run(batch)
+            with self._lock:
+                self._counters["batches"] += 1
+                self._counters["failed_batches"] += 1 if failed else 0
+                self._counters["failed_items"] += failed
+                self._counters["items"] += len(batch)
+                self._counters["busy_seconds"] += time.perf_counter() - start
@@ -1,39 +1,46 @@
-from ultralytics import YOLO
-import tempfile
+from models.config import BATCH_SIZE
+from models.inference import run_batch
 
-model = YOLO("runs/detect/train5/weights/best.pt")
 
-
-def run_detection(uploaded_file):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
-        temp.write(uploaded_file.read())
-        temp_path = temp.name
-
-    results = model.predict(temp_path)
-
-    rbc_count = 0
-    wbc_count = 0
-    for result in results:
-        boxes = result.boxes
-        for box in boxes:
-            cls_id = int(box.cls[0])
-            if cls_id == 0:
-                rbc_count += 1
-            elif cls_id == 1:
-                wbc_count += 1
+def _summarize(record):
+    counts = record.counts(minlength=2)
+    rbc_count = int(counts[0])
+    wbc_count = int(counts[1])
     if wbc_count == 0:
         ratio = float('inf')
     else:
         ratio = rbc_count / wbc_count
-    return results, rbc_count, wbc_count, ratio
+    return record, rbc_count, wbc_count, ratio
+
+
+def run_detection_batch(uploaded_files, batch_size=BATCH_SIZE, errors=None, profile=None, sample=None):
+    return run_batch("blood_cells", uploaded_files, _summarize, batch_size, errors, profile, sample)
+
 
+def run_detection(uploaded_file, profile=None):
+    return run_detection_batch([uploaded_file], profile=profile)[0]
 
-def check_ratio(ratio):
+
+def cell_counts(output):
+    # (RBC, WBC) in one run_detection_batch output
+    _, rbc_count, wbc_count, _ = output
+    return rbc_count, wbc_count
+
+
+def _ratio_band(ratio):
     if 4 <= ratio <= 10:
-        status = "RBC/WBC ratio is within normal range. Sample shows a healthy distribution of blood cells."
+        return "RBC/WBC ratio is within normal range. Sample shows a healthy distribution of blood cells."
     elif ratio < 4:
-        status = "Detected relatively fewer RBCs compared to WBCs. Possible anemia or low RBC count."
-    else:
-        status = "Detected relatively high RBCs compared to WBCs. Sample seems within safe range, but verify with more images."
+        return "Detected relatively fewer RBCs compared to WBCs. Possible anemia or low RBC count."
+    return "Detected relatively high RBCs compared to WBCs. Sample seems within safe range, but verify with more images."
+
+
+def check_ratio(ratio, interval=None):
+    # interval: optional (low, high) bounds of the ratio. The status is only
+    # given when both bounds fall in the same range.
+    status = _ratio_band(ratio)
+    if interval is not None and _ratio_band(interval[0]) != _ratio_band(interval[1]):
+        status = (f"Inconclusive: the RBC/WBC ratio could be anywhere from {interval[0]:.2f} "
+                  f"to {interval[1]:.2f}. Analyze more images to settle it.")
 
     return status
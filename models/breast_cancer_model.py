@@ -1,51 +1,182 @@
+import os
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-import pandas as pd
-from ultralytics import YOLO
-import tempfile
-import tensorflow as tf
-
-model = YOLO("../scripts/runs/segment/train2/weights/best.pt")
-scaler = StandardScaler()
-data = pd.read_csv("dataset/breast-cancer.csv")
-X = data.iloc[:, 2:].values
-scaler.fit(X)
-
-
-def run_detection(uploaded_file):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
-        temp.write(uploaded_file.read())
-        temp_path = temp.name
-        file_name = uploaded_file.name
-
-    results = model.predict(temp_path)
-
-    benign = []
-    malignant = []
-    conf = []
-    for r in results:
-        for box in r.boxes:
-            c_id = int(box.cls[0])
-            c = round(float(box.conf[0]), 4)
-            if c_id == 1:
-                benign.append(c_id)
-                conf.append(c)
-            if c_id == 2:
-                malignant.append(c_id)
-                conf.append(c)
-
-    return file_name, conf, benign, malignant
-
-
-def run_classification(radius_mean, texture_mean, perimeter_mean, area_mean, smoothness_mean, compactness_mean, concavity_mean, concave_points_mean, symmetry_mean, fractal_dimension_mean, radius_se, texture_se, perimeter_se, area_se, smoothness_se, compactness_se, concavity_se, concave_points_se, symmetry_se, fractal_dimension_se, radius_worst, texture_worst, perimeter_worst, area_worst, smoothness_worst, compactness_worst, concavity_worst, concave_points_worst, symmetry_worst, fractal_dimension_worst):
-    ann = tf.keras.models.load_model("scripts/breast_cancer.keras")
-    return ann.predict(scaler.transform(np.array([radius_mean, texture_mean, perimeter_mean, area_mean, smoothness_mean, compactness_mean, concavity_mean, concave_points_mean, symmetry_mean, fractal_dimension_mean, radius_se, texture_se, perimeter_se, area_se, smoothness_se,
-                                                  compactness_se, concavity_se, concave_points_se, symmetry_se, fractal_dimension_se, radius_worst, texture_worst, perimeter_worst, area_worst, smoothness_worst, compactness_worst, concavity_worst, concave_points_worst, symmetry_worst, fractal_dimension_worst]).reshape(1, -1)))
+from models.inference import run_batch
+from models.config import BREAST_CANCER_DATASET, BREAST_CANCER_SCALER, SCORING_BATCH_SIZE, BATCH_SIZE
+from models.registry import get_model
+from models.tracing import span
+
+
+def _summarize(record):
+    is_benign = record.cls == 1
+    is_malignant = record.cls == 2
+    benign = [1] * int(np.count_nonzero(is_benign))
+    malignant = [2] * int(np.count_nonzero(is_malignant))
+    conf = record.rounded_conf(4, mask=is_benign | is_malignant)
+
+    return record.file_name, conf, benign, malignant, record
+
+
+def lesion_rows(record):
+    # One table row per segmented lesion, sizes in image pixels
+    return [{"Image": record.file_name,
+             "Class": record.names.get(int(cls_id), str(cls_id)),
+             "Confidence": round(float(conf), 3),
+             "Area (px²)": lesion["area"],
+             "Equivalent diameter (px)": lesion["equivalent_diameter"],
+             "Major axis (px)": lesion["ellipse"]["major_axis"],
+             "Minor axis (px)": lesion["ellipse"]["minor_axis"],
+             "Angle (°)": lesion["ellipse"]["angle"],
+             "Max IoU": lesion["max_iou"],
+             "Overlapped": lesion["overlap"]}
+            for cls_id, conf, lesion in zip(record.cls, record.conf, record.lesions())]
+
+
+def mask_footprint(record):
+    # Memory and post-processing time of the masks against keeping one
+    # full-resolution mask per lesion
+    masks = record.masks
+    if masks is None:
+        return None
+    return {"Image": record.file_name, "Lesions": len(masks),
+            "Lesion area (px²)": round(masks.union_area(), 1),
+            "Masks (KB)": round(masks.nbytes / 1024, 1),
+            "Dense masks (KB)": round(masks.dense_nbytes(record.image_shape) / 1024, 1),
+            "Mask processing (ms)": round(masks.seconds * 1000, 2)}
+
+
+def run_detection_batch(uploaded_files, batch_size=BATCH_SIZE, errors=None, profile=None, sample=None):
+    return run_batch("breast_cancer", uploaded_files, _summarize, batch_size, errors, profile, sample)
+
+
+def run_detection(uploaded_file, profile=None):
+    return run_detection_batch([uploaded_file], profile=profile)[0]
+
+
+FEATURE_COLUMNS = [
+    "radius_mean", "texture_mean", "perimeter_mean", "area_mean", "smoothness_mean",
+    "compactness_mean", "concavity_mean", "concave_points_mean", "symmetry_mean", "fractal_dimension_mean",
+    "radius_se", "texture_se", "perimeter_se", "area_se", "smoothness_se",
+    "compactness_se", "concavity_se", "concave_points_se", "symmetry_se", "fractal_dimension_se",
+    "radius_worst", "texture_worst", "perimeter_worst", "area_worst", "smoothness_worst",
+    "compactness_worst", "concavity_worst", "concave_points_worst", "symmetry_worst", "fractal_dimension_worst"
+]
+
+
+class TabularClassifier:
+    # StandardScaler + ANN folded into one object: scaling is a single
+    # broadcasted numpy op and the ANN is called directly rather than through
+    # Model.predict, which sets up a tf.data pipeline on every call.
+    def __init__(self, ann, mean, scale):
+        self.ann = ann
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.mean.size)
+        return ((X - self.mean) / self.scale).astype(np.float32)
+
+    def predict_proba(self, X):
+        with span("ann.scale"):
+            X = self.transform(X)
+        with span("ann.forward", rows=len(X)):
+            return np.asarray(self.ann(X, training=False)).reshape(-1)
+
+    def predict(self, X):
+        return (self.predict_proba(X) > 0.5).astype(np.int64)
+
+
+def fit_scaler(csv_path=BREAST_CANCER_DATASET, out_path=BREAST_CANCER_SCALER):
+    import pandas as pd
+
+    X = pd.read_csv(csv_path).iloc[:, 2:].to_numpy(dtype=np.float64)
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    np.savez(out_path, mean=mean, scale=scale)
+    return mean, scale
+
+
+def load_scaler(path=BREAST_CANCER_SCALER):
+    # Never refitted here: the dataset CSV is not shipped, and a page rerun
+    # should not write files
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found; rebuild it from {BREAST_CANCER_DATASET} with "
+            f"`python -m models.breast_cancer_model`")
+    with np.load(path) as f:
+        return f["mean"], f["scale"]
+
+
+def load_classifier():
+    from models.backends import load_ann
+
+    mean, scale = load_scaler()
+    return TabularClassifier(load_ann(), mean, scale)
 
 
 def run_classification(data):
-    ann = tf.keras.models.load_model("scripts/breast_cancer.keras")
-    return int(ann.predict(scaler.transform(np.array(data).reshape(1, -1))) > 0.5)
+    classifier = get_model("breast_cancer_ann")
+    labels = classifier.predict(data)
+    if np.ndim(data) == 1:
+        return int(labels[0])
+    return labels
+
+
+def read_feature_table(source, file_name=None):
+    import pandas as pd
+
+    file_name = file_name or getattr(source, "name", str(source))
+    if file_name.lower().endswith((".parquet", ".pq")):
+        return pd.read_parquet(source)
+    return pd.read_csv(source)
+
+
+def validate_features(df):
+    import pandas as pd
+
+    # breast-cancer.csv spells some columns "concave points_mean"
+    columns = {str(c).strip().lower().replace(" ", "_"): c for c in df.columns}
+    missing = [c for c in FEATURE_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+
+    X = df[[columns[c] for c in FEATURE_COLUMNS]].apply(
+        pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    bad_rows = np.flatnonzero(np.isnan(X).any(axis=1))
+    if bad_rows.size:
+        raise ValueError(
+            f"{bad_rows.size} row(s) have missing or non-numeric feature values "
+            f"(first at row {bad_rows[0] + 1})")
+    return X
+
+
+def score_table(df, batch_size=SCORING_BATCH_SIZE):
+    import pandas as pd
+
+    with span("ann.validate", rows=len(df)):
+        X = validate_features(df)
+    classifier = get_model("breast_cancer_ann")
+    proba = np.empty(len(X), dtype=np.float32)
+    for start in range(0, len(X), batch_size):
+        proba[start:start + batch_size] = classifier.predict_proba(
+            X[start:start + batch_size])
+
+    results = pd.DataFrame(index=df.index)
+    for column in ("id", "diagnosis"):
+        if column in df.columns:
+            results[column] = df[column]
+    results["probability"] = proba
+    results["prediction"] = np.where(proba > 0.5, "Malignant", "Benign")
+    return results
+
+
+def score_file(source, batch_size=SCORING_BATCH_SIZE, file_name=None):
+    return score_table(read_feature_table(source, file_name), batch_size)
+
+
+if __name__ == "__main__":
+    mean, scale = fit_scaler()
+    print(f"Saved scaler for {mean.size} features to {BREAST_CANCER_SCALER}")
 
 # M -> 1
 # B -> 0
@@ -0,0 +1,74 @@
+import threading
+
+import numpy as np
+
+from models.config import BATCH_SIZE, CASCADES
+from models.records import Detections
+from models.tiling import nms
+from models.tracing import span
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def uncertain_fraction(record, band):
+    if len(record) == 0:
+        return 0.0
+    low, high = band
+    return float(np.count_nonzero((record.conf >= low) & (record.conf < high))) / len(record)
+
+
+def needs_escalation(record, cascade):
+    return uncertain_fraction(record, cascade["band"]) > cascade["max_uncertain"]
+
+
+def merge(small, large, band, iou):
+    # The small model's confident detections plus everything the large model
+    # found, de-duplicated with class-aware NMS
+    confident = small.conf >= band[1]
+    boxes = np.concatenate([small.boxes[confident], large.boxes])
+    conf = np.concatenate([small.conf[confident], large.conf])
+    cls = np.concatenate([small.cls[confident], large.cls])
+    mask_area = None
+    if small.mask_area is not None and large.mask_area is not None:
+        mask_area = np.concatenate([small.mask_area[confident], large.mask_area])
+    keep = nms(boxes, conf, cls, iou)
+    masks = None
+    if small.masks is not None and large.masks is not None and small.masks.shape == large.masks.shape:
+        from models.masks import MaskSet
+
+        dense = np.concatenate([small.masks.decode(confident), large.masks.decode()])
+        masks = MaskSet.from_dense(dense[keep], large.masks.scale, boxes[keep])
+    return Detections(large.file_name, cls[keep], conf[keep], boxes[keep], large.image_shape,
+                      large.names or small.names,
+                      None if mask_area is None else mask_area[keep], large.profile, masks)
+
+
+def predict_cascade(model_id, named_images, profile=None, batch_size=BATCH_SIZE):
+    from models.inference import predict_images, resolve_profile
+
+    cascade = CASCADES[model_id]
+    _, params = resolve_profile(model_id, profile)
+    with span("cascade.small", model=cascade["small"], images=len(named_images)):
+        records = predict_images(model_id, named_images, profile, batch_size,
+                                 model_name=cascade["small"])
+    escalate = [i for i, record in enumerate(records) if needs_escalation(record, cascade)]
+    if escalate:
+        with span("cascade.large", model=cascade["large"], images=len(escalate)):
+            larger = predict_images(model_id, [named_images[i] for i in escalate], profile,
+                                    batch_size, model_name=cascade["large"])
+        for i, large in zip(escalate, larger):
+            records[i] = merge(records[i], large, cascade["band"], params.get("iou", 0.7))
+
+    with _lock:
+        stats = _stats.setdefault(model_id, {"images": 0, "escalated": 0})
+        stats["images"] += len(named_images)
+        stats["escalated"] += len(escalate)
+    return records
+
+
+def cascade_stats():
+    with _lock:
+        return {model_id: dict(stats, escalated_fraction=round(
+                    stats["escalated"] / stats["images"], 3) if stats["images"] else 0.0)
+                for model_id, stats in _stats.items()}
@@ -0,0 +1,212 @@
+import os
+
+MODEL_PATHS = {
+    "blood_cells": "runs/detect/train5/weights/best.pt",
+    "malarial_cells": "../scripts/runs/detect/train2/weights/best.pt",
+    "breast_cancer": "../scripts/runs/segment/train2/weights/best.pt",
+    "breast_cancer_ann": "scripts/breast_cancer.keras",
+}
+
+MODEL_TASKS = {
+    "blood_cells": "detect",
+    "malarial_cells": "detect",
+    "breast_cancer": "segment",
+}
+
+# Image size each detector was trained at (see the runs/*/args.yaml files)
+TRAIN_IMGSZ = {
+    "blood_cells": 640,
+    "malarial_cells": 320,
+    "breast_cancer": 320,
+}
+
+# Inference profiles per model. "default" matches the training settings above;
+# "fast" trades some accuracy for latency. BIOSCAN_PROFILE picks the default
+# profile for the process and the sidebar can switch it per session. `half` is
+# only honoured on CUDA with the PyTorch backend.
+PROFILES = {
+    "blood_cells": {
+        "default": {"imgsz": TRAIN_IMGSZ["blood_cells"], "conf": 0.25, "iou": 0.7, "max_det": 300, "half": True},
+        "fast": {"imgsz": 416, "conf": 0.3, "iou": 0.6, "max_det": 300, "half": True},
+    },
+    "malarial_cells": {
+        "default": {"imgsz": TRAIN_IMGSZ["malarial_cells"], "conf": 0.25, "iou": 0.7, "max_det": 300, "half": True},
+        "fast": {"imgsz": 256, "conf": 0.3, "iou": 0.6, "max_det": 300, "half": True},
+    },
+    "breast_cancer": {
+        "default": {"imgsz": TRAIN_IMGSZ["breast_cancer"], "conf": 0.25, "iou": 0.7, "max_det": 100, "half": True},
+        "fast": {"imgsz": 256, "conf": 0.3, "iou": 0.6, "max_det": 50, "half": True},
+    },
+}
+PROFILE_NAMES = ["default", "fast"]
+
+# Other weights from the training runs (see their args.yaml). They load through
+# the registry like the main models and share the task, profiles, dataset and
+# backend of `base`.
+MODEL_VARIANTS = {
+    "blood_cells_m": {"base": "blood_cells", "path": "runs/detect/train3/weights/best.pt"},  # yolov8m
+    "breast_cancer_n": {"base": "breast_cancer", "path": "../scripts/runs/segment/train3/weights/best.pt"},  # yolo11n-seg
+    "breast_cancer_m": {"base": "breast_cancer", "path": "../scripts/runs/segment/train4/weights/best.pt"},  # yolov8m-seg
+}
+
+# Confidence-gated cascades: `small` runs on every image and an image is re-run
+# through `large` when more than `max_uncertain` (a fraction) of its detections
+# have a confidence inside `band`; the two results are then merged. Enabled per
+# model with BIOSCAN_CASCADE=blood_cells,breast_cancer or BIOSCAN_CASCADE=all.
+CASCADES = {
+    "blood_cells": {"small": "blood_cells", "large": "blood_cells_m",
+                    "band": (0.25, 0.5), "max_uncertain": 0.1},
+    "breast_cancer": {"small": "breast_cancer_n", "large": "breast_cancer",
+                      "band": (0.25, 0.5), "max_uncertain": 0.0},
+}
+_cascade_env = [name.strip() for name in os.environ.get("BIOSCAN_CASCADE", "").split(",")
+                if name.strip()]
+CASCADE_MODELS = list(CASCADES) if "all" in _cascade_env else \
+    [name for name in _cascade_env if name in CASCADES]
+DEFAULT_PROFILE = os.environ.get("BIOSCAN_PROFILE", "default")
+
+DATASET_YAMLS = {
+    "blood_cells": "scripts/blood_cells_dataset.yaml",
+    "malarial_cells": "scripts/malarial_cells_dataset.yaml",
+    "breast_cancer": "scripts/breast_cancer_dataset.yaml",
+}
+
+# Box annotations (image, xmin, ymin, xmax, ymax, label in pixels) converted to
+# YOLO label files by `python -m scripts.prepare_dataset`
+DATASET_ANNOTATIONS = {
+    "blood_cells": "scripts/annotations.csv",
+}
+# Threads reading image headers and label files while preparing a dataset
+DATASET_WORKERS = int(os.environ.get("BIOSCAN_DATASET_WORKERS", min(16, os.cpu_count() or 4)))
+
+# Inference backend per model: "pytorch" (or "keras" for the ANN), "onnx" or
+# "openvino". Exported artifacts are built with `python -m scripts.export_models`.
+# The ANN defaults to "numpy", a plain NumPy forward pass over weights taken
+# from the Keras model, so serving it never imports TensorFlow. Its weights
+# file is exported once (with TensorFlow) by
+# `python -m scripts.export_models breast_cancer_ann --backend numpy`; until
+# then the ANN loads the Keras model, with a warning.
+# BIOSCAN_BACKEND sets every model, BIOSCAN_BACKEND_<MODEL> a single one, and
+# BIOSCAN_INT8=1 selects the INT8-quantized artifacts.
+_DEFAULT_BACKENDS = {
+    "blood_cells": "pytorch",
+    "malarial_cells": "pytorch",
+    "breast_cancer": "pytorch",
+    "breast_cancer_ann": "numpy",
+}
+BACKENDS = {
+    name: os.environ.get(f"BIOSCAN_BACKEND_{name.upper()}",
+                         os.environ.get("BIOSCAN_BACKEND", default))
+    for name, default in _DEFAULT_BACKENDS.items()
+}
+INT8 = os.environ.get("BIOSCAN_INT8", "0") == "1"
+
+BREAST_CANCER_DATASET = "dataset/breast-cancer.csv"
+# Scaler mean/scale saved next to the ANN (the StandardScaler the app used to
+# fit on the whole dataset CSV); rebuilt with `python -m models.breast_cancer_model`.
+BREAST_CANCER_SCALER = "scripts/breast_cancer_scaler.npz"
+# Rows per ANN forward pass when scoring uploaded CSV/Parquet tables
+SCORING_BATCH_SIZE = 4096
+
+# Comma separated model names to load in the background when the app starts,
+# e.g. BIOSCAN_WARMUP=blood_cells,malarial_cells or BIOSCAN_WARMUP=all
+WARMUP_MODELS = [name.strip() for name in os.environ.get(
+    "BIOSCAN_WARMUP", "").split(",") if name.strip()]
+
+# Images per model.predict call in the run_detection_batch functions
+BATCH_SIZE = int(os.environ.get("BIOSCAN_BATCH_SIZE", 8))
+
+# Upload limits enforced by models.ingest before anything reaches a model.
+# Images are decoded whole (tiled inference included), so MAX_IMAGE_PIXELS
+# also caps the memory one image takes: about 300 MB at the default.
+MAX_IMAGES = int(os.environ.get("BIOSCAN_MAX_IMAGES", 200))
+MAX_IMAGE_BYTES = int(os.environ.get("BIOSCAN_MAX_IMAGE_BYTES", 50 * 2**20))
+MAX_IMAGE_PIXELS = int(os.environ.get("BIOSCAN_MAX_IMAGE_PIXELS", 100_000_000))
+
+# Per-image detection results kept in memory, keyed by content hash, model and
+# inference parameters. Set BIOSCAN_CACHE_DIR to also persist them on disk.
+RESULT_CACHE_SIZE = int(os.environ.get("BIOSCAN_CACHE_SIZE", 256))
+RESULT_CACHE_DIR = os.environ.get("BIOSCAN_CACHE_DIR") or None
+
+# Analysis history: a SQLite file recording every analyzed image once per model
+# version and profile, with its detections, plus running totals per sample or
+# patient ID (set in the sidebar). Later runs of the same image reuse the
+# stored detections. Off unless BIOSCAN_HISTORY_DB names the file, e.g.
+# history/bioscan.sqlite3.
+HISTORY_DB = os.environ.get("BIOSCAN_HISTORY_DB") or None
+HISTORY_TREND_LIMIT = int(os.environ.get("BIOSCAN_HISTORY_TREND_LIMIT", 500))
+
+# Images drawn from each dataset YAML's val split for INT8 calibration and
+# for the accuracy drift check against the PyTorch weights
+CALIBRATION_IMAGES = int(os.environ.get("BIOSCAN_CALIBRATION_IMAGES", 200))
+
+# Large smear captures are split into overlapping tiles at the profile imgsz
+# instead of being downscaled as a whole. Tiling kicks in when the longer side
+# exceeds TILE_TRIGGER x imgsz; TILE_OVERLAP (fraction of a tile) should be
+# larger than the biggest cell so every cell lies fully inside some tile.
+TILED_MODELS = ("blood_cells", "malarial_cells")
+TILE_TRIGGER = float(os.environ.get("BIOSCAN_TILE_TRIGGER", 2.0))
+TILE_OVERLAP = float(os.environ.get("BIOSCAN_TILE_OVERLAP", 0.2))
+
+# Background detection jobs. JOB_WORKERS caps how many jobs run at once on
+# this node (each already uses several torch threads); JOB_QUEUE_SIZE caps
+# queued + running jobs before new submissions are refused.
+JOB_WORKERS = int(os.environ.get("BIOSCAN_JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.environ.get("BIOSCAN_JOB_QUEUE_SIZE", 16))
+JOB_HISTORY = int(os.environ.get("BIOSCAN_JOB_HISTORY", 64))
+
+# Streaming totals on the cells and malaria pages carry Wilson score intervals
+# at SAMPLING_CONFIDENCE. With early stopping (the sidebar toggle, defaulting to
+# BIOSCAN_EARLY_STOP) a job stops once the interval on the share of cells that
+# are infected (malaria) or RBCs (RBC/WBC ratio) is narrower than the model's
+# tolerance, after at least EARLY_STOP_MIN_IMAGES images.
+SAMPLING_CONFIDENCE = float(os.environ.get("BIOSCAN_SAMPLING_CONFIDENCE", 0.95))
+EARLY_STOP = os.environ.get("BIOSCAN_EARLY_STOP", "0") == "1"
+EARLY_STOP_TOLERANCE = {
+    "blood_cells": float(os.environ.get("BIOSCAN_EARLY_STOP_TOLERANCE_BLOOD_CELLS", 0.02)),
+    "malarial_cells": float(os.environ.get("BIOSCAN_EARLY_STOP_TOLERANCE_MALARIAL_CELLS", 0.02)),
+}
+EARLY_STOP_MIN_IMAGES = int(os.environ.get("BIOSCAN_EARLY_STOP_MIN_IMAGES", 3))
+
+# Local HTTP service (scripts/serve.py). Concurrent requests for the same model
+# are collected for up to SERVICE_MAX_WAIT_MS into one forward pass of at most
+# SERVICE_MAX_BATCH images; beyond SERVICE_QUEUE_SIZE waiting requests the
+# service answers 503 instead of queueing more.
+SERVICE_HOST = os.environ.get("BIOSCAN_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("BIOSCAN_SERVICE_PORT", 8502))
+SERVICE_MAX_BATCH = int(os.environ.get("BIOSCAN_SERVICE_MAX_BATCH", BATCH_SIZE))
+SERVICE_MAX_WAIT_MS = float(os.environ.get("BIOSCAN_SERVICE_MAX_WAIT_MS", 5))
+SERVICE_QUEUE_SIZE = int(os.environ.get("BIOSCAN_SERVICE_QUEUE_SIZE", 64))
+
+# Stored results of `python -m scripts.benchmark --save-baseline`; later runs
+# fail when p95 latency, throughput or peak RSS regress by more than
+# BENCHMARK_TOLERANCE (a fraction) against it.
+BENCHMARK_BASELINE = "scripts/benchmark_baseline.json"
+BENCHMARK_TOLERANCE = float(os.environ.get("BIOSCAN_BENCHMARK_TOLERANCE", 0.15))
+
+# Stage timings (models.tracing). The last TRACE_HISTORY page runs and jobs
+# are kept for the sidebar debug panel. BIOSCAN_PROFILER=cprofile or
+# pyinstrument also profiles each traced run; BIOSCAN_TRACE_LOG=1 logs every
+# finished trace as one JSON line on the "bioscan.trace" logger.
+TRACE_HISTORY = int(os.environ.get("BIOSCAN_TRACE_HISTORY", 50))
+PROFILER = os.environ.get("BIOSCAN_PROFILER") or None
+TRACE_LOG = os.environ.get("BIOSCAN_TRACE_LOG", "0") == "1"
+
+# Upload previews (models.previews): thumbnails and detection overlays are
+# encoded once per image at these sizes (longer side, px) and cached by
+# content hash, so reruns never re-send the original uploads to the browser.
+THUMBNAIL_SIZE = int(os.environ.get("BIOSCAN_THUMBNAIL_SIZE", 400))
+OVERLAY_SIZE = int(os.environ.get("BIOSCAN_OVERLAY_SIZE", 800))
+PREVIEW_CACHE_SIZE = int(os.environ.get("BIOSCAN_PREVIEW_CACHE_SIZE", 512))
+
+# Content hashes remembered per Streamlit upload (UploadedFile.file_id), so the
+# reruns that poll a job don't re-hash every upload for dedup, job ids and previews
+UPLOAD_HASH_CACHE_SIZE = int(os.environ.get("BIOSCAN_UPLOAD_HASH_CACHE_SIZE", 4096))
+PREVIEW_WORKERS = int(os.environ.get("BIOSCAN_PREVIEW_WORKERS", 4))
+PREVIEW_QUALITY = 85
+
+# Duplicate uploads (models.dedup). Byte-identical images are always analyzed
+# once; with near-duplicate matching on, images whose 64-bit difference hashes
+# differ in at most DEDUP_MAX_DISTANCE bits are treated as the same image too.
+DEDUP_NEAR = os.environ.get("BIOSCAN_DEDUP_NEAR", "0") == "1"
+DEDUP_MAX_DISTANCE = int(os.environ.get("BIOSCAN_DEDUP_MAX_DISTANCE", 4))
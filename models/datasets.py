@@ -0,0 +1,231 @@
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from models.config import DATASET_WORKERS
+from models.ingest import IMAGE_EXTENSIONS, image_size
+
+SPLITS = ("train", "val", "test")
+
+
+def load_spec(data_yaml):
+    import yaml
+
+    with open(data_yaml) as f:
+        spec = yaml.safe_load(f)
+    if not spec.get("names"):
+        raise ValueError(f"{data_yaml} has no class names")
+    return spec
+
+
+def class_names(spec):
+    names = spec["names"]
+    return dict(enumerate(names)) if isinstance(names, list) else {int(k): v for k, v in names.items()}
+
+
+def split_dir(data_yaml, split, spec=None):
+    spec = spec or load_spec(data_yaml)
+    entry = spec.get(split)
+    if not entry:
+        return None
+    root = spec.get("path", "")
+    # The YAMLs are written relative to scripts/, where the notebooks run
+    candidates = [os.path.join(os.path.dirname(data_yaml), root, entry),
+                  os.path.join(root, entry)]
+    directory = next((c for c in candidates if os.path.isdir(c)), None)
+    if directory is None:
+        raise FileNotFoundError(
+            f"No {split} images for {data_yaml}; looked in {', '.join(candidates)}")
+    return directory
+
+
+def split_images(directory):
+    return sorted(path for path in glob.glob(os.path.join(directory, "*"))
+                  if path.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def label_path(image_path, labels_dir=None):
+    # Ultralytics looks for .../labels/<split>/<stem>.txt next to
+    # .../images/<split>/<stem>.<ext>
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    if labels_dir is not None:
+        return os.path.join(labels_dir, stem + ".txt")
+    images = f"{os.sep}images{os.sep}"
+    head, sep, tail = image_path.rpartition(images)
+    directory = os.path.dirname(head + f"{os.sep}labels{os.sep}" + tail if sep else image_path)
+    return os.path.join(directory, stem + ".txt")
+
+
+def index_images(data_yaml, spec=None):
+    # {file name: path} over every split; a name in two splits is an error
+    # since its labels would leak between training and validation
+    spec = spec or load_spec(data_yaml)
+    index, errors = {}, []
+    for directory in sorted({d for d in (split_dir(data_yaml, s, spec) for s in SPLITS) if d}):
+        for path in split_images(directory):
+            name = os.path.basename(path)
+            if name in index:
+                errors.append(f"{name} is in both {os.path.dirname(index[name])} and {directory}")
+                continue
+            index[name] = path
+    return index, errors
+
+
+def read_annotations(csv_path, names):
+    # One row per box: image, xmin, ymin, xmax, ymax, label (pixels)
+    import pandas as pd
+
+    frame = pd.read_csv(csv_path)
+    frame["image"] = frame["image"].astype(str).str.strip()
+    labels = frame["label"].astype(str).str.strip().str.lower()
+    class_ids = {name.lower(): cls_id for cls_id, name in names.items()}
+    frame["class_id"] = labels.map(class_ids)
+    unknown = sorted(labels[frame["class_id"].isna()].unique())
+    if unknown:
+        raise ValueError(f"{csv_path} has labels not in the dataset: {', '.join(unknown)}")
+    frame["class_id"] = frame["class_id"].astype(np.int64)
+    return frame
+
+
+def image_sizes(paths, workers=DATASET_WORKERS):
+    # Headers only, read in parallel; {path: (width, height)}
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(image_size, paths)))
+
+
+def normalize_boxes(frame, sizes):
+    # Pixel corners to YOLO (cx, cy, w, h) relative to each image's real size,
+    # in one pass over the whole table. Returns (boxes, degenerate mask).
+    width = frame["path"].map({path: size[0] for path, size in sizes.items()}).to_numpy(np.float64)
+    height = frame["path"].map({path: size[1] for path, size in sizes.items()}).to_numpy(np.float64)
+    corners = frame[["xmin", "ymin", "xmax", "ymax"]].to_numpy(np.float64)
+    scale = np.stack([width, height, width, height], axis=1)
+    corners = np.clip(corners / scale, 0.0, 1.0)
+    x1, y1, x2, y2 = corners.T
+    boxes = np.stack([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], axis=1)
+    return boxes, (boxes[:, 2] <= 0) | (boxes[:, 3] <= 0)
+
+
+def _write_if_changed(path, text):
+    try:
+        with open(path) as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        if not text:
+            return False  # no boxes and no stale file to clear
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return True
+
+
+def prepare_labels(data_yaml, csv_path, labels_dir=None, workers=DATASET_WORKERS):
+    # Each label file is written once with all of its boxes, and only when its
+    # contents change, so re-running the conversion is safe. Every image of the
+    # dataset is covered: one left without valid boxes has an existing label
+    # file emptied, so labels from an earlier run never survive.
+    spec = load_spec(data_yaml)
+    frame = read_annotations(csv_path, class_names(spec))
+    index, errors = index_images(data_yaml, spec)
+    frame["path"] = frame["image"].map(index)
+    missing = sorted(frame.loc[frame["path"].isna(), "image"].unique())
+    frame = frame[frame["path"].notna()]
+
+    boxes, degenerate = normalize_boxes(frame, image_sizes(frame["path"].unique(), workers))
+    lines = [f"{cls_id} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}"
+             for cls_id, (cx, cy, w, h) in zip(frame["class_id"].to_numpy(), boxes)]
+    frame = frame.assign(line=lines)[~degenerate]
+    texts = frame.groupby("path", sort=True)["line"].agg(lambda rows: "\n".join(rows) + "\n")
+
+    images = sorted(index.values())
+    contents = [texts.get(path, "") for path in images]
+    paths = [label_path(path, labels_dir) for path in images]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        written = list(pool.map(_write_if_changed, paths, contents))
+    emptied = sum(1 for changed, text in zip(written, contents) if changed and not text)
+    return {"images": len(texts), "boxes": len(frame), "written": sum(written) - emptied,
+            "emptied": emptied, "unchanged": len(texts) - (sum(written) - emptied),
+            "degenerate": int(degenerate.sum()), "missing_images": missing, "errors": errors}
+
+
+def _check_label(path, num_classes, task):
+    # Mirrors the checks Ultralytics applies when it scans a label file
+    try:
+        with open(path) as f:
+            rows = [line.split() for line in f.read().strip().splitlines() if line.strip()]
+    except FileNotFoundError:
+        return 0, None
+    if not rows:
+        return 0, None
+    widths = {len(row) for row in rows}
+    if task == "segment":
+        bad = [w for w in widths if w < 7 or w % 2 == 0]
+    else:
+        bad = [w for w in widths if w != 5]
+    if bad:
+        return len(rows), f"{path}: rows with {bad[0]} values"
+    try:
+        cls_ids = np.array([row[0] for row in rows], dtype=np.float64)
+        coords = np.array([value for row in rows for value in row[1:]], dtype=np.float64)
+    except ValueError:
+        return len(rows), f"{path}: non-numeric values"
+    if (cls_ids < 0).any() or (cls_ids >= num_classes).any() or (cls_ids % 1).any():
+        return len(rows), f"{path}: class ids outside 0..{num_classes - 1}"
+    if (coords < 0).any() or (coords > 1).any():
+        return len(rows), f"{path}: coordinates outside [0, 1]"
+    return len(rows), None
+
+
+def validate_dataset(data_yaml, task="detect", workers=DATASET_WORKERS):
+    spec = load_spec(data_yaml)
+    num_classes = len(class_names(spec))
+    report = {"splits": {}, "errors": []}
+    for split in ("train", "val"):
+        if not spec.get(split):
+            report["errors"].append(f"{data_yaml} has no {split} split")
+    try:
+        report["errors"] += index_images(data_yaml, spec)[1]
+    except FileNotFoundError as e:
+        report["errors"].append(str(e))
+        return report
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for split in SPLITS:
+            directory = split_dir(data_yaml, split, spec)
+            if directory is None:
+                continue
+            images = split_images(directory)
+            checked = list(pool.map(lambda p: _check_label(label_path(p), num_classes, task), images))
+            report["splits"][split] = {
+                "directory": directory,
+                "images": len(images),
+                "labelled": sum(1 for rows, _ in checked if rows),
+                "boxes": sum(rows for rows, _ in checked),
+            }
+            report["errors"] += [error for _, error in checked if error]
+            if not images:
+                report["errors"].append(f"{directory} has no images")
+    return report
+
+
+def build_label_cache(data_yaml, task="detect", imgsz=640):
+    # Scanning the labels writes Ultralytics' labels/<split>.cache; training
+    # then loads it instead of re-reading every image and label file
+    from ultralytics.data.dataset import YOLODataset
+
+    spec = load_spec(data_yaml)
+    names = class_names(spec)
+    data = {"names": names, "nc": len(names), "channels": 3}
+    caches = {}
+    for directory in sorted({d for d in (split_dir(data_yaml, s, spec) for s in SPLITS) if d}):
+        dataset = YOLODataset(img_path=directory, data=data, task=task, imgsz=imgsz,
+                              augment=False, prefix=f"{os.path.basename(directory)}: ")
+        if dataset.label_files:
+            caches[directory] = os.path.dirname(dataset.label_files[0]) + ".cache"
+    return caches
@@ -0,0 +1,98 @@
+import numpy as np
+
+from models.cache import ResultCache
+from models.config import DEDUP_MAX_DISTANCE, PREVIEW_CACHE_SIZE
+from models.ingest import decode_bytes, file_name_of, read_buffer
+from models.inference import upload_hash
+
+# Difference hashes by content hash, so reruns only hash new uploads
+_hash_cache = ResultCache(PREVIEW_CACHE_SIZE, disk_dir=None)
+
+
+def difference_hash(image, size=8):
+    # dHash: sign of the horizontal gradient on a (size+1) x size grayscale
+    # thumbnail; robust to re-encoding, resizing and small exposure changes
+    import cv2
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _upload_dhash(uploaded_file, digest):
+    cached = _hash_cache.get(digest)
+    if cached is None:
+        image = decode_bytes(read_buffer(uploaded_file), file_name_of(uploaded_file), max_side=64)
+        cached = difference_hash(image)
+        _hash_cache.put(digest, cached)
+    return cached
+
+
+def deduplicate(uploaded_files, near=False, max_distance=DEDUP_MAX_DISTANCE):
+    # Returns {"unique": files to analyze, "duplicates": [(name, original
+    # name, "exact" | "near")], "copies": {content hash: uploads}}, with one
+    # copies entry per unique file. Uploads are tracked by position, so files
+    # that share a name but not their content are never merged.
+    files = list(uploaded_files)
+    digests = [upload_hash(uploaded_file) for uploaded_file in files]
+    # root[i]: position of the upload that upload i is analyzed as
+    root = list(range(len(files)))
+    # parent: {position: (position it copies, "exact" | "near")}
+    parent = {}
+    first = {}
+    for i, digest in enumerate(digests):
+        if digest in first:
+            root[i] = first[digest]
+            parent[i] = (first[digest], "exact")
+        else:
+            first[digest] = i
+    candidates = list(first.values())
+
+    if near and len(candidates) > 1:
+        hashes = []
+        for i in candidates:
+            try:
+                hashes.append(_upload_dhash(files[i], digests[i]))
+            except ValueError:
+                hashes.append(None)  # unreadable, left for the detector to report
+        valid = np.array([h is not None for h in hashes])
+        values = np.array([h or 0 for h in hashes], dtype=np.uint64)
+        distance = np.bitwise_count(values[:, None] ^ values[None, :])
+        close = (distance <= max_distance) & valid[:, None] & valid[None, :]
+
+        kept = []
+        for a, i in enumerate(candidates):
+            match = next((b for b in kept if close[a, b]), None)
+            if match is None:
+                kept.append(a)
+            else:
+                root[i] = candidates[match]
+                parent[i] = (candidates[match], "near")
+        # Exact copies of a near duplicate follow it to the kept upload
+        root = [root[r] for r in root]
+
+    unique = [i for i in range(len(files)) if root[i] == i]
+    copies = {digests[i]: 0 for i in unique}
+    for r in root:
+        copies[digests[r]] += 1
+    duplicates = [(file_name_of(files[i]), file_name_of(files[original]), kind)
+                  for i, (original, kind) in sorted(parent.items())]
+    return {"unique": [files[i] for i in unique], "duplicates": duplicates, "copies": copies}
+
+
+def duplicate_weights(report, include):
+    # Per-image multiplier for totals, by content hash (Detections.digest):
+    # every upload counts when duplicates are included, otherwise each
+    # distinct image counts once
+    return report["copies"] if include else {}
+
+
+def describe_duplicates(report, include):
+    if not report["duplicates"]:
+        return None
+    skipped = ", ".join(f"{name} ({kind} copy of {original})"
+                        for name, original, kind in report["duplicates"])
+    counted = "included in" if include else "excluded from"
+    return (f"{len(report['duplicates'])} duplicate image(s) were not re-analyzed and are "
+            f"{counted} the totals: {skipped}")
@@ -0,0 +1,255 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from models.config import HISTORY_DB, HISTORY_TREND_LIMIT
+from models.masks import MaskSet
+from models.records import Detections
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    file_name TEXT,
+    created_at REAL NOT NULL,
+    detections INTEGER NOT NULL,
+    counts TEXT NOT NULL,
+    mean_conf REAL,
+    image_shape TEXT NOT NULL,
+    names TEXT NOT NULL,
+    cls BLOB NOT NULL,
+    conf BLOB NOT NULL,
+    boxes BLOB NOT NULL,
+    mask_area BLOB,
+    masks BLOB,
+    UNIQUE (content_hash, model_id, model_version, profile)
+);
+CREATE INDEX IF NOT EXISTS analyses_by_time ON analyses (model_id, created_at);
+CREATE TABLE IF NOT EXISTS sample_images (
+    sample_id TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    analysis_id INTEGER NOT NULL REFERENCES analyses (id),
+    added_at REAL NOT NULL,
+    PRIMARY KEY (sample_id, model_id, content_hash)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    sample_id TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    images INTEGER NOT NULL,
+    detections INTEGER NOT NULL,
+    counts TEXT NOT NULL,
+    first_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (sample_id, model_id)
+);
+CREATE INDEX IF NOT EXISTS samples_by_time ON samples (model_id, updated_at);
+"""
+
+
+def _counts(record):
+    return {int(cls_id): stats["count"] for cls_id, stats in record.class_stats().items()}
+
+
+def _add_counts(total, counts):
+    for cls_id, count in counts.items():
+        total[str(cls_id)] = total.get(str(cls_id), 0) + count
+    return total
+
+
+def _row_to_record(row):
+    (file_name, image_shape, names, profile, cls, conf, boxes, mask_area, masks) = row
+    return Detections(
+        file_name, np.frombuffer(cls, dtype=np.int64), np.frombuffer(conf, dtype=np.float32),
+        np.frombuffer(boxes, dtype=np.float32), json.loads(image_shape),
+        {int(k): v for k, v in json.loads(names).items()},
+        None if mask_area is None else np.frombuffer(mask_area, dtype=np.float32), profile,
+        None if masks is None else MaskSet.from_bytes(masks))
+
+
+class HistoryStore:
+    # Per-image detection summaries and the Detections arrays themselves, so
+    # history queries and repeat analyses never need the model. Running totals
+    # per sample are updated as images are linked to it, never recomputed.
+    # With path=None every call is a no-op, like ResultCache without disk_dir.
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self.hits = 0
+        self.writes = 0
+        self.errors = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Opened on first use; one connection shared under the lock, WAL so
+        # the app and the scripts can read while another process writes
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            # Stores created before masks were kept
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(analyses)")}
+            if "masks" not in columns:
+                conn.execute("ALTER TABLE analyses ADD COLUMN masks BLOB")
+            self._conn = conn
+        return self._conn
+
+    def get(self, digest, model_id, model_version, profile):
+        if not self.path:
+            return None
+        with self._lock:
+            try:
+                row = self._connection().execute(
+                    "SELECT file_name, image_shape, names, profile, cls, conf, boxes, mask_area, masks "
+                    "FROM analyses WHERE content_hash = ? AND model_id = ? AND model_version = ? "
+                    "AND profile = ?", (digest, model_id, model_version, profile)).fetchone()
+            except (sqlite3.Error, OSError):
+                self.errors += 1
+                return None
+            if row is None:
+                return None
+            self.hits += 1
+        return _row_to_record(row)
+
+    def record(self, model_id, model_version, profile, entries, sample=None):
+        # entries: (content hash, Detections) pairs from one analysis call.
+        # Images already stored are left as they are; each distinct image is
+        # added to the sample's totals once.
+        if not self.path or not entries:
+            return
+        now = time.time()
+        # Images already stored are skipped before their arrays and masks are
+        # serialized; INSERT OR IGNORE still covers a concurrent writer
+        stored = self._stored(model_id, model_version, profile, {digest for digest, _ in entries})
+        new = {}
+        for digest, record in entries:
+            if digest not in stored:
+                new.setdefault(digest, record)
+        rows = [(digest, model_id, model_version, profile, record.file_name, now, len(record),
+                 json.dumps(_counts(record)),
+                 float(record.conf.mean()) if len(record) else None,
+                 json.dumps(list(record.image_shape)), json.dumps(record.names),
+                 record.cls.tobytes(), record.conf.tobytes(), record.boxes.tobytes(),
+                 None if record.mask_area is None else record.mask_area.tobytes(),
+                 None if record.masks is None else record.masks.to_bytes())
+                for digest, record in new.items()]
+        if not rows and not sample:
+            return
+        with self._lock:
+            try:
+                conn = self._connection()
+                with conn:
+                    cursor = conn.executemany(
+                        "INSERT OR IGNORE INTO analyses (content_hash, model_id, model_version, "
+                        "profile, file_name, created_at, detections, counts, mean_conf, "
+                        "image_shape, names, cls, conf, boxes, mask_area, masks) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    self.writes += max(cursor.rowcount, 0)
+                    if sample:
+                        self._link(conn, sample, model_id, model_version, profile, entries, now)
+            except (sqlite3.Error, OSError):
+                self.errors += 1
+
+    def _stored(self, model_id, model_version, profile, digests):
+        digests = sorted(digests)
+        stored = set()
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(digests), 500):
+            chunk = digests[start:start + 500]
+            stored.update(digest for (digest,) in self._query(
+                f"SELECT content_hash FROM analyses WHERE model_id = ? AND model_version = ? "
+                f"AND profile = ? AND content_hash IN ({', '.join('?' * len(chunk))})",
+                (model_id, model_version, profile, *chunk)))
+        return stored
+
+    def _link(self, conn, sample, model_id, model_version, profile, entries, now):
+        added = {}
+        for digest, record in entries:
+            if digest in added:
+                continue
+            (analysis_id,) = conn.execute(
+                "SELECT id FROM analyses WHERE content_hash = ? AND model_id = ? "
+                "AND model_version = ? AND profile = ?",
+                (digest, model_id, model_version, profile)).fetchone()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO sample_images (sample_id, model_id, content_hash, "
+                "analysis_id, added_at) VALUES (?, ?, ?, ?, ?)",
+                (sample, model_id, digest, analysis_id, now))
+            if cursor.rowcount:
+                added[digest] = record
+        if not added:
+            return
+
+        row = conn.execute("SELECT images, detections, counts FROM samples "
+                           "WHERE sample_id = ? AND model_id = ?", (sample, model_id)).fetchone()
+        images, detections, counts = row if row else (0, 0, "{}")
+        counts = json.loads(counts)
+        for record in added.values():
+            _add_counts(counts, _counts(record))
+        conn.execute(
+            "INSERT INTO samples (sample_id, model_id, images, detections, counts, first_at, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (sample_id, model_id) DO UPDATE "
+            "SET images = excluded.images, detections = excluded.detections, "
+            "counts = excluded.counts, updated_at = excluded.updated_at",
+            (sample, model_id, images + len(added),
+             detections + sum(len(record) for record in added.values()),
+             json.dumps(counts), now, now))
+
+    def _query(self, sql, params):
+        if not self.path:
+            return []
+        with self._lock:
+            try:
+                return self._connection().execute(sql, params).fetchall()
+            except (sqlite3.Error, OSError):
+                self.errors += 1
+                return []
+
+    def samples(self, model_id, limit=HISTORY_TREND_LIMIT):
+        rows = self._query(
+            "SELECT sample_id, images, detections, counts, first_at, updated_at FROM samples "
+            "WHERE model_id = ? ORDER BY updated_at DESC LIMIT ?", (model_id, limit))
+        return [{"sample": sample, "images": images, "detections": detections,
+                 "counts": {int(k): v for k, v in json.loads(counts).items()},
+                 "first_at": first_at, "updated_at": updated_at}
+                for sample, images, detections, counts, first_at, updated_at in rows]
+
+    def trend(self, model_id, classes=(0, 1), limit=HISTORY_TREND_LIMIT, by="image"):
+        # The latest `limit` images or samples, oldest first, with the share of
+        # classes[0] among `classes`: infected among malaria cells, RBCs among
+        # blood cells. Both walk the (model_id, time) indexes.
+        if by == "sample":
+            rows = [(row["sample"], row["updated_at"], row["counts"])
+                    for row in self.samples(model_id, limit)]
+        else:
+            rows = [(file_name, created_at, {int(k): v for k, v in json.loads(counts).items()})
+                    for file_name, created_at, counts in self._query(
+                        "SELECT file_name, created_at, counts FROM analyses WHERE model_id = ? "
+                        "ORDER BY created_at DESC LIMIT ?", (model_id, limit))]
+        points = []
+        for name, at, counts in reversed(rows):
+            positive = counts.get(classes[0], 0)
+            total = sum(counts.get(cls_id, 0) for cls_id in classes)
+            points.append({"name": name, "time": at, "positive": positive, "total": total,
+                           "share": positive / total if total else None})
+        return points
+
+    def stats(self):
+        counts = self._query("SELECT (SELECT COUNT(*) FROM analyses), "
+                             "(SELECT COUNT(*) FROM samples)", ())
+        analyses, samples = counts[0] if counts else (0, 0)
+        return {"path": self.path, "analyses": analyses, "samples": samples,
+                "hits": self.hits, "writes": self.writes, "errors": self.errors}
+
+
+# Shared by every session in the process, like models.cache.result_cache
+history_store = HistoryStore()
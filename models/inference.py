@@ -0,0 +1,190 @@
+import functools
+import os
+
+from models.cache import ResultCache, content_hash, result_cache
+from models.backends import artifact_path
+from models.config import (BACKENDS, BATCH_SIZE, CASCADE_MODELS, CASCADES, DEFAULT_PROFILE,
+                           PROFILES, TILED_MODELS, TILE_OVERLAP, TILE_TRIGGER,
+                           UPLOAD_HASH_CACHE_SIZE)
+from models.history import history_store
+from models.ingest import batched, check_image_count, decode_image, file_name_of, read_buffer
+from models.records import Detections
+from models.registry import get_model, predict_lock
+from models.tiling import detect_tiled, needs_tiling
+from models.tracing import record_speed, span
+
+
+_upload_hashes = ResultCache(UPLOAD_HASH_CACHE_SIZE, disk_dir=None)
+
+
+def upload_hash(uploaded_file):
+    # Streamlit uploads keep their file_id across reruns
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id is None:
+        return content_hash(read_buffer(uploaded_file))
+    digest = _upload_hashes.get(file_id)
+    if digest is None:
+        digest = content_hash(read_buffer(uploaded_file))
+        _upload_hashes.put(file_id, digest)
+    return digest
+
+
+@functools.lru_cache(maxsize=None)
+def _cuda_available():
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+def resolve_profile(model_id, profile=None):
+    profile = profile or DEFAULT_PROFILE
+    profiles = PROFILES[model_id]
+    if profile not in profiles:
+        raise ValueError(
+            f"Unknown profile {profile!r} for {model_id}, expected one of {', '.join(profiles)}")
+    params = dict(profiles[profile])
+    params["half"] = bool(params.get("half")) and BACKENDS[model_id] == "pytorch" \
+        and _cuda_available()
+    return profile, params
+
+
+def describe_profile(model_id, profile=None):
+    # Shown on every page render, so it leaves out the half-precision check
+    # that resolve_profile needs torch for.
+    profile = profile or DEFAULT_PROFILE
+    params = {k: v for k, v in PROFILES[model_id][profile].items() if k != "half"}
+    details = ", ".join(f"{k}={v}" for k, v in params.items())
+    return f"{profile} ({details})"
+
+
+def _key_params(model_id, params):
+    key_params = dict(params)
+    if model_id in TILED_MODELS:
+        key_params["tiling"] = f"{TILE_TRIGGER}/{TILE_OVERLAP}"
+    if model_id in CASCADE_MODELS:
+        cascade = CASCADES[model_id]
+        key_params["cascade"] = (f"{cascade['small']}>{cascade['large']}"
+                                 f"@{cascade['band']}/{cascade['max_uncertain']}")
+    return key_params
+
+
+def cache_key(model_id, digest, params):
+    return result_cache.key(digest, f"{model_id}:{artifact_path(model_id)}",
+                            _key_params(model_id, params))
+
+
+def model_version(model_id, params):
+    # Names the weights (path, size and mtime, so retraining in place counts
+    # as a new version) and the settings behind a record, for the history store
+    path = artifact_path(model_id)
+    try:
+        stat = os.stat(path)
+        weights = f"{path}@{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        weights = path
+    return result_cache.key(weights, model_id, _key_params(model_id, params))
+
+
+def predict_images(model_id, named_images, profile=None, batch_size=BATCH_SIZE,
+                   model_name=None):
+    # Decoded (name, image) pairs -> Detections records, no caching. Images
+    # much larger than the model input go through tiled inference. model_name
+    # runs one of model_id's variants instead; without it, models with an
+    # enabled cascade go through the cascade.
+    if model_name is None and model_id in CASCADE_MODELS:
+        from models.cascade import predict_cascade
+        return predict_cascade(model_id, named_images, profile, batch_size)
+
+    profile, params = resolve_profile(model_id, profile)
+    model = get_model(model_name or model_id)
+    lock = predict_lock(model_name or model_id)
+
+    records = [None] * len(named_images)
+    regular = []
+    for index, (name, image) in enumerate(named_images):
+        if needs_tiling(model_id, image, params["imgsz"]):
+            with span("tiled_predict", model=model_id, image=name), lock:
+                records[index] = detect_tiled(model, image, name, params,
+                                              batch_size, profile=profile)
+        else:
+            regular.append(index)
+
+    for chunk in batched(regular, batch_size):
+        with span("predict", model=model_id, images=len(chunk)), lock:
+            results = model.predict([named_images[index][1] for index in chunk],
+                                    verbose=False, **params)
+        record_speed([named_images[index][0] for index in chunk], results)
+        with span("to_records", images=len(chunk)):
+            for index, result in zip(chunk, results):
+                records[index] = Detections.from_result(named_images[index][0],
+                                                        result, profile)
+    return records
+
+
+def run_batch(model_id, uploaded_files, summarize, batch_size=BATCH_SIZE,
+              errors=None, profile=None, sample=None):
+    # Shared driver behind every run_detection_batch: cached images are
+    # answered from the result cache or the history store (which also files
+    # them under `sample`, if given), the rest are decoded and predicted in
+    # chunks of batch_size. Each Ultralytics result is reduced to a compact
+    # Detections record before it is cached or summarized, so neither the
+    # cache nor the pages hold on to decoded images or tensors.
+    # Unreadable files are skipped and reported through `errors` as
+    # (file name, message) pairs; without an errors list they raise.
+    check_image_count(uploaded_files)
+    profile, params = resolve_profile(model_id, profile)
+    version = model_version(model_id, params)
+    records = [None] * len(uploaded_files)
+    digests = [upload_hash(uploaded_file) for uploaded_file in uploaded_files]
+    pending = []
+    # Repeats of an image within this call wait for its first copy
+    repeats = {}
+    with span("cache_lookup", images=len(uploaded_files)):
+        for index, uploaded_file in enumerate(uploaded_files):
+            key = cache_key(model_id, digests[index], params)
+            if key in repeats:
+                repeats[key].append(index)
+                continue
+            cached = result_cache.get(key)
+            if cached is None:
+                cached = history_store.get(digests[index], model_id, version, profile)
+                if cached is not None:
+                    result_cache.put(key, cached)
+            if cached is None:
+                repeats[key] = []
+                pending.append((index, key, uploaded_file))
+            else:
+                records[index] = cached.with_file_name(file_name_of(uploaded_file), digests[index])
+
+    for batch in batched(pending, batch_size):
+        decoded = []
+        for index, key, uploaded_file in batch:
+            try:
+                with span("decode", image=file_name_of(uploaded_file)):
+                    image = decode_image(uploaded_file)
+            except ValueError as e:
+                if errors is None:
+                    raise
+                errors.append((file_name_of(uploaded_file), str(e)))
+                continue
+            decoded.append((index, key, file_name_of(uploaded_file), image))
+        if not decoded:
+            continue
+
+        predicted = predict_images(model_id, [(name, image) for _, _, name, image in decoded],
+                                   profile, batch_size)
+        for (index, key, _, _), record in zip(decoded, predicted):
+            record.digest = digests[index]
+            records[index] = record
+            result_cache.put(key, record)
+            for repeat in repeats[key]:
+                records[repeat] = record.with_file_name(file_name_of(uploaded_files[repeat]))
+
+    with span("history"):
+        history_store.record(model_id, version, profile,
+                             [(digest, record) for digest, record in zip(digests, records)
+                              if record is not None], sample)
+    with span("summarize"):
+        return [summarize(record) for record in records if record is not None]
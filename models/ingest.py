@@ -0,0 +1,165 @@
+import functools
+import io
+
+import numpy as np
+
+from models.config import MAX_IMAGES, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS
+
+
+# cv2 and Pillow are imported on the first decode rather than with the module,
+# so pages that never touch an image don't pay for them.
+@functools.lru_cache(maxsize=None)
+def _cv2():
+    try:
+        import cv2
+    except ImportError:
+        return None
+    return cv2
+
+
+@functools.lru_cache(maxsize=None)
+def _pil_image():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+def file_name_of(uploaded_file):
+    return getattr(uploaded_file, "name", "image")
+
+
+def read_buffer(uploaded_file):
+    # Streamlit's UploadedFile is a BytesIO, so getbuffer() exposes the upload
+    # without copying it and regardless of the current read position.
+    if isinstance(uploaded_file, (bytes, bytearray, memoryview)):
+        return memoryview(uploaded_file)
+    if hasattr(uploaded_file, "getbuffer"):
+        return uploaded_file.getbuffer()
+    if isinstance(uploaded_file, str):
+        with open(uploaded_file, "rb") as f:
+            return memoryview(f.read())
+    return memoryview(uploaded_file.read())
+
+
+def _check_pixels(width, height, name):
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(
+            f"{name} is {width}x{height} pixels, above the limit of {MAX_IMAGE_PIXELS:,}")
+
+
+def _reduced_flag(cv2, size, max_side):
+    # libjpeg can decode at 1/2, 1/4 or 1/8 scale directly, which is much
+    # cheaper than decoding the full image and resizing it
+    if max_side is None or size is None:
+        return cv2.IMREAD_COLOR, 1
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if max(size) / factor >= max_side:
+            return flag, factor
+    return cv2.IMREAD_COLOR, 1
+
+
+def decode_bytes(buffer, name="image", max_side=None):
+    # With max_side the image may come back downscaled by up to 8x, never
+    # below max_side on its longer edge; used for previews only.
+    if buffer.nbytes > MAX_IMAGE_BYTES:
+        raise ValueError(
+            f"{name} is {buffer.nbytes / 2**20:.1f} MB, above the limit of {MAX_IMAGE_BYTES / 2**20:.0f} MB")
+
+    cv2, Image = _cv2(), _pil_image()
+    # Read the header first so oversized images are refused before decoding
+    size = None
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(buffer)) as header:
+                size = header.size
+                _check_pixels(*size, name)
+        except Image.DecompressionBombError as e:
+            raise ValueError(f"{name} is too large to decode: {e}")
+        except OSError:
+            pass
+
+    image = None
+    factor = 1
+    if cv2 is not None:
+        flag, factor = _reduced_flag(cv2, size, max_side)
+        image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), flag)
+    elif Image is not None:
+        try:
+            with Image.open(io.BytesIO(buffer)) as pil_image:
+                # BGR to match what cv2 and Ultralytics expect for arrays
+                image = np.ascontiguousarray(
+                    np.asarray(pil_image.convert("RGB"))[..., ::-1])
+        except OSError:
+            image = None
+    else:
+        raise ImportError("Decoding images requires opencv-python or Pillow")
+
+    if image is None:
+        raise ValueError(f"{name} is not a readable image")
+    if factor == 1:
+        _check_pixels(image.shape[1], image.shape[0], name)
+    return image
+
+
+def decode_image(uploaded_file):
+    return decode_bytes(read_buffer(uploaded_file), file_name_of(uploaded_file))
+
+
+def image_size(path):
+    # (width, height) from the file header; Pillow doesn't decode the pixels
+    Image = _pil_image()
+    if Image is not None:
+        try:
+            with Image.open(path) as header:
+                return header.size
+        except OSError:
+            pass
+    cv2 = _cv2()
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED) if cv2 is not None else None
+    if image is None:
+        raise ValueError(f"{path} is not a readable image")
+    return image.shape[1], image.shape[0]
+
+
+def check_image_count(uploaded_files):
+    if len(uploaded_files) > MAX_IMAGES:
+        raise ValueError(
+            f"{len(uploaded_files)} images uploaded, at most {MAX_IMAGES} can be analyzed at once")
+
+
+def batched(items, batch_size):
+    items = list(items)
+    batch_size = max(1, batch_size)
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def letterbox(image, imgsz, color=(114, 114, 114)):
+    # Same resize-and-pad Ultralytics applies before inference. Returns the
+    # padded image, the resize gain and the (left, top) padding so boxes can
+    # be mapped back onto the original image.
+    import cv2
+
+    h, w = image.shape[:2]
+    gain = min(imgsz / h, imgsz / w)
+    new_w, new_h = round(w * gain), round(h * gain)
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    left = (imgsz - new_w) // 2
+    top = (imgsz - new_h) // 2
+    padded = cv2.copyMakeBorder(image, top, imgsz - new_h - top, left,
+                                imgsz - new_w - left, cv2.BORDER_CONSTANT,
+                                value=color)
+    return padded, gain, (left, top)
+
+
+def to_input_tensor(images):
+    # Letterboxed BGR uint8 images -> float32 NCHW RGB batch in [0, 1]
+    batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
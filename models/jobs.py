@@ -0,0 +1,138 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from models.config import BATCH_SIZE, JOB_HISTORY, JOB_QUEUE_SIZE, JOB_WORKERS
+from models.inference import upload_hash
+from models.tracing import span, trace
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, total, name="job"):
+        self.id = job_id
+        self.name = name
+        self.total = total
+        self.completed = 0
+        self.results = []
+        self.errors = []
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished_at = None
+        self.trace = None
+        self.stopped_early = False
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def progress(self):
+        return self.completed / self.total if self.total else 1.0
+
+    def snapshot(self):
+        # Copies taken under the lock so a page can render partial results
+        # while the worker keeps appending.
+        with self._lock:
+            return list(self.results), list(self.errors)
+
+    def _add(self, outputs, errors, count):
+        with self._lock:
+            self.results.extend(outputs)
+            self.errors.extend(errors)
+            self.completed += count
+
+
+class JobManager:
+    # One per process: jobs outlive Streamlit reruns and a session picks up
+    # its job again by its id, which is derived from the uploads themselves.
+    def __init__(self, max_workers=JOB_WORKERS, max_active=JOB_QUEUE_SIZE,
+                 history=JOB_HISTORY):
+        self.max_active = max_active
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="bioscan-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit(self, job_id, fn, items, chunk_size=BATCH_SIZE, name="job", stop_when=None):
+        # fn(chunk, errors=list) -> list of outputs, e.g. run_detection_batch.
+        # stop_when(outputs so far) -> bool is checked after every chunk and
+        # ends the job early, leaving the remaining items unprocessed.
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != "failed":
+                return job
+            active = sum(1 for j in self._jobs.values() if not j.finished)
+            if active >= self.max_active:
+                raise JobQueueFull(
+                    f"{active} analyses are already queued on this server, please retry shortly")
+            job = Job(job_id, len(items), name)
+            self._jobs[job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, list(items), chunk_size, stop_when)
+        return job
+
+    def running(self):
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status == "running"]
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status)
+                for status in ("queued", "running", "done", "failed")}
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _run(self, job, fn, items, chunk_size, stop_when=None):
+        job.status = "running"
+        try:
+            with trace(f"job {job.name}") as job.trace:
+                for start in range(0, len(items), chunk_size):
+                    chunk = items[start:start + chunk_size]
+                    errors = []
+                    with span("chunk", images=len(chunk)):
+                        outputs = fn(chunk, errors=errors)
+                    job._add(outputs, errors, len(chunk))
+                    if stop_when is not None and job.completed < job.total \
+                            and stop_when(job.snapshot()[0]):
+                        job.stopped_early = True
+                        break
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+
+def job_key(kind, uploaded_files, session=None, **params):
+    # Outputs carry the submitting session's file names and sample, so jobs
+    # are never shared between sessions; the result cache still shares the
+    # model work itself.
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(kind.encode())
+    digest.update(f"|session={session}".encode())
+    for name in sorted(params):
+        digest.update(f"|{name}={params[name]}".encode())
+    for uploaded_file in uploaded_files:
+        digest.update(upload_hash(uploaded_file).encode())
+    return digest.hexdigest()
+
+
+job_manager = JobManager()
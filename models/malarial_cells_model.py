@@ -1,59 +1,61 @@
-import os
-from ultralytics import YOLO
-import tempfile
+import numpy as np
+from models.config import BATCH_SIZE
+from models.inference import run_batch
 
-model = YOLO("../scripts/runs/detect/train2/weights/best.pt")
 
-
-def run_detection(uploaded_file):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
-        temp.write(uploaded_file.read())
-        temp_path = temp.name
-        file_name = uploaded_file.name
-
-    results = model.predict(temp_path)
+def _summarize(record):
+    file_name = record.file_name
+    infected = int(np.count_nonzero(record.cls == 0))
 
     data = {
-        "Infected": [],
-        "Uninfected": [],
-        "Confidence_rate": [],
-        "File Name": []
+        "Infected": [file_name] * infected,
+        "Uninfected": [file_name] * (len(record) - infected),
+        "Confidence_rate": record.rounded_conf(4),
+        "File Name": [file_name] * len(record)
     }
 
-    for r in results:
-        for box in r.boxes:
-            detection_id = box.cls[0]
-            conf_rate = round(float(box.conf[0].cpu().item()), 4)
-            cell_type = "Infected" if detection_id == 0 else "Uninfected"
+    return data, record
+
+
+def run_detection_batch(uploaded_files, batch_size=BATCH_SIZE, errors=None, profile=None, sample=None):
+    return run_batch("malarial_cells", uploaded_files, _summarize, batch_size, errors, profile, sample)
+
+
+def run_detection(uploaded_file, profile=None):
+    return run_detection_batch([uploaded_file], profile=profile)[0]
+
 
-            if cell_type == "Infected":
-                data["Infected"].append(file_name)
-            else:
-                data["Uninfected"].append(file_name)
+def infection_counts(output):
+    # (infected, uninfected) cells in one run_detection_batch output
+    data, _ = output
+    return len(data["Infected"]), len(data["Uninfected"])
 
-            data["Confidence_rate"].append(conf_rate)
-            data["File Name"].append(file_name)
 
-    return data, results
+def _malaria_band(infection_percent):
+    if infection_percent <= 1:
+        return "Healthy ✅"
+    elif infection_percent <= 5:
+        return "Mild / Monitor ⚠️"
+    elif infection_percent <= 20:
+        return "Moderate / Consult Doctor ⚠️"
+    return "Severe / Seek Medical Attention ❌"
 
 
-def check_malaria_status(infected_count, uninfected_count):
+def check_malaria_status(infected_count, uninfected_count, interval=None):
+    # interval: optional (low, high) bounds of the infection percentage. The
+    # status is only given when both bounds fall in the same band.
+    note = ("ℹ️ **Disclaimer:** This is an AI-generated result for educational/demo purposes. "
+            "It does not replace real medical advice or diagnosis.")
     total_cells = infected_count + uninfected_count
     if total_cells == 0:
-        return "No cells detected.", 0.0
+        return "No cells detected.", 0.0, note
 
     infection_ratio = infected_count / total_cells * 100
 
-    if infection_ratio <= 1:
-        status = "Healthy ✅"
-    elif infection_ratio <= 5:
-        status = "Mild / Monitor ⚠️"
-    elif infection_ratio <= 20:
-        status = "Moderate / Consult Doctor ⚠️"
-    else:
-        status = "Severe / Seek Medical Attention ❌"
-
-    note = "ℹ️ **Disclaimer:** This is an AI-generated result for educational/demo purposes. "
-    "It does not replace real medical advice or diagnosis."
+    status = _malaria_band(infection_ratio)
+    if interval is not None:
+        low, high = _malaria_band(interval[0]), _malaria_band(interval[1])
+        if low != high:
+            status = f"Inconclusive: between {low} and {high}, analyze more images"
 
     return status, infection_ratio, note
@@ -0,0 +1,218 @@
+import io
+import time
+
+import numpy as np
+
+
+def _boxes_intersect(boxes):
+    # Index pairs (i < j) whose boxes overlap; Ultralytics crops every mask to
+    # its box, so only these pairs can have overlapping masks
+    i, j = np.triu_indices(len(boxes), k=1)
+    x1 = np.maximum(boxes[i, 0], boxes[j, 0])
+    y1 = np.maximum(boxes[i, 1], boxes[j, 1])
+    x2 = np.minimum(boxes[i, 2], boxes[j, 2])
+    y2 = np.minimum(boxes[i, 3], boxes[j, 3])
+    hit = (x2 > x1) & (y2 > y1)
+    return i[hit], j[hit]
+
+
+def _encode(dense):
+    # Row-wise runs of foreground pixels, (instance, y, x, length), in one
+    # pass over all instances. Runs never cross image rows, which keeps the
+    # moment sums below in closed form.
+    n, h, w = dense.shape
+    flat = dense.reshape(n * h, w)
+    # Masks are cropped to their boxes, so most rows are empty
+    active = np.flatnonzero(flat.any(axis=1))
+    padded = np.zeros((len(active), w + 2), dtype=bool)
+    padded[:, 1:-1] = flat[active]
+    rows, cols = np.nonzero(padded[:, 1:] != padded[:, :-1])
+    starts, ends = cols[0::2], cols[1::2]
+    rows = active[rows[0::2]]
+    instance = rows // h
+    runs = np.stack([rows % h, starts, ends - starts], axis=1).astype(np.uint16)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(instance, minlength=n))])
+    return runs, offsets
+
+
+def _moments(runs, offsets):
+    # Pixel count, centroid and covariance per instance in mask pixels, summed
+    # over runs: a run of l pixels from column x covers centres x+0.5 .. x+l-0.5
+    n = len(offsets) - 1
+    instance = np.repeat(np.arange(n), np.diff(offsets))
+    y = runs[:, 0].astype(np.float64) + 0.5
+    a = runs[:, 1].astype(np.float64) + 0.5
+    l = runs[:, 2].astype(np.float64)
+    sx = l * a + l * (l - 1) / 2
+    sxx = l * a * a + a * l * (l - 1) + (l - 1) * l * (2 * l - 1) / 6
+
+    def total(values):
+        return np.bincount(instance, weights=values, minlength=n)
+
+    pixels = total(l)
+    safe = np.maximum(pixels, 1)
+    cx, cy = total(sx) / safe, total(l * y) / safe
+    cov = np.stack([total(sxx) / safe - cx * cx,
+                    total(l * y * y) / safe - cy * cy,
+                    total(y * sx) / safe - cx * cy], axis=1)
+    return (pixels.astype(np.int64), np.stack([cx, cy], axis=1).astype(np.float32),
+            cov.astype(np.float32))
+
+
+def _overlaps(dense, boxes):
+    # Max IoU with any other instance and the share of each instance's area
+    # also covered by another one, with packed bits over candidate pairs only
+    n = len(dense)
+    packed = np.packbits(dense.reshape(n, dense.shape[1] * dense.shape[2]), axis=1)
+    pixels = np.bitwise_count(packed).sum(axis=1)
+    union = int(np.bitwise_count(np.bitwise_or.reduce(packed, axis=0)).sum()) if n else 0
+    max_iou, overlap = np.zeros(n, np.float32), np.zeros(n, np.float32)
+    i, j = _boxes_intersect(boxes)
+    if len(i):
+        shared = packed[i] & packed[j]
+        inter = np.bitwise_count(shared).sum(axis=1)
+        iou = inter / np.maximum(pixels[i] + pixels[j] - inter, 1)
+        np.maximum.at(max_iou, i, iou)
+        np.maximum.at(max_iou, j, iou)
+        multi = np.bitwise_or.reduce(shared, axis=0)
+        overlap = (np.bitwise_count(packed & multi).sum(axis=1)
+                   / np.maximum(pixels, 1)).astype(np.float32)
+    return max_iou, overlap, union
+
+
+class MaskSet:
+    # Instance masks of one image as row runs at the model's mask resolution
+    # (letterbox padding cropped), a few bytes per run instead of a dense
+    # array per instance. Shape statistics are computed once from the runs;
+    # `scale` maps mask pixels to image pixels, so metrics() and render
+    # work in image coordinates without upsampling any mask.
+    __slots__ = ("shape", "scale", "runs", "offsets", "pixels", "mean", "cov",
+                 "max_iou", "overlap", "union_pixels", "seconds")
+
+    @classmethod
+    def from_dense(cls, dense, scale, boxes):
+        start = time.perf_counter()
+        masks = cls.__new__(cls)
+        masks.shape = tuple(dense.shape[1:])
+        masks.scale = (float(scale[0]), float(scale[1]))
+        masks.runs, masks.offsets = _encode(dense)
+        masks.pixels, masks.mean, masks.cov = _moments(masks.runs, masks.offsets)
+        masks.max_iou, masks.overlap, masks.union_pixels = _overlaps(dense, boxes)
+        masks.seconds = time.perf_counter() - start
+        return masks
+
+    @classmethod
+    def from_result(cls, data, image_shape, boxes):
+        # data: Ultralytics masks.data, (N, mh, mw) at the letterboxed input
+        # size. The padding is cropped as in ultralytics.utils.ops.scale_masks.
+        start = time.perf_counter()
+        h, w = image_shape[:2]
+        mask_h, mask_w = data.shape[1:]
+        gain = min(mask_h / h, mask_w / w)
+        pad_w, pad_h = (mask_w - w * gain) / 2, (mask_h - h * gain) / 2
+        top, left = int(round(pad_h - 0.1)), int(round(pad_w - 0.1))
+        bottom, right = int(round(mask_h - pad_h + 0.1)), int(round(mask_w - pad_w + 0.1))
+        dense = (data[:, top:bottom, left:right] > 0.5).cpu().numpy()
+        masks = cls.from_dense(dense, (w / (right - left), h / (bottom - top)), boxes)
+        masks.seconds = time.perf_counter() - start
+        return masks
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _fill(self, index):
+        # Flat pixel positions and local instance number for the runs of the
+        # selected instances, without a Python loop over runs
+        index = np.arange(len(self)) if index is None else np.asarray(index).reshape(-1)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        counts = np.diff(self.offsets)[index]
+        first = np.repeat(self.offsets[index] - (np.cumsum(counts) - counts), counts)
+        runs = self.runs[first + np.arange(counts.sum())].astype(np.int64)
+        lengths = runs[:, 2]
+        local = np.repeat(np.repeat(np.arange(len(index)), counts), lengths)
+        ramp = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        flat = np.repeat(runs[:, 0] * self.shape[1] + runs[:, 1], lengths) + ramp
+        return index, local, flat
+
+    def decode(self, index=None):
+        # Dense (n, h, w) bool masks at mask resolution, for the selection only
+        index, local, flat = self._fill(index)
+        dense = np.zeros((len(index), self.shape[0] * self.shape[1]), dtype=bool)
+        dense[local, flat] = True
+        return dense.reshape(len(index), *self.shape)
+
+    def label_map(self, index=None):
+        # (h, w) map of 1-based instance numbers, later instances on top
+        index, local, flat = self._fill(index)
+        labels = np.zeros(self.shape[0] * self.shape[1], dtype=np.uint16)
+        labels[flat] = index[local] + 1
+        return labels.reshape(self.shape)
+
+    def subset(self, index, boxes):
+        # Overlap statistics depend on which instances remain, so the selection
+        # is re-measured rather than sliced
+        return MaskSet.from_dense(self.decode(index), self.scale, boxes)
+
+    def scaled(self, factor):
+        masks = MaskSet.__new__(MaskSet)
+        for attr in self.__slots__:
+            setattr(masks, attr, getattr(self, attr))
+        masks.scale = (self.scale[0] * factor, self.scale[1] * factor)
+        return masks
+
+    def areas(self):
+        return (self.pixels * self.scale[0] * self.scale[1]).astype(np.float32)
+
+    def metrics(self):
+        # Per-instance lesion measurements in image pixels. The ellipse has the
+        # same second moments as the mask (as in skimage regionprops); its axes
+        # are full lengths and the angle is from the image x axis, clockwise.
+        sx, sy = self.scale
+        area = self.areas().astype(np.float64)
+        xx, yy, xy = self.cov[:, 0] * sx * sx, self.cov[:, 1] * sy * sy, self.cov[:, 2] * sx * sy
+        spread = np.sqrt(((xx - yy) / 2) ** 2 + xy ** 2)
+        major = 4 * np.sqrt(np.maximum((xx + yy) / 2 + spread, 0))
+        minor = 4 * np.sqrt(np.maximum((xx + yy) / 2 - spread, 0))
+        return {
+            "area": area,
+            "equivalent_diameter": np.sqrt(4 * area / np.pi),
+            "center": self.mean * np.array([sx, sy]),
+            "major_axis": major,
+            "minor_axis": minor,
+            "angle": np.degrees(0.5 * np.arctan2(2 * xy, xx - yy)),
+            "max_iou": self.max_iou,
+            "overlap": self.overlap,
+        }
+
+    def union_area(self):
+        return float(self.union_pixels * self.scale[0] * self.scale[1])
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, attr).nbytes for attr in
+                   ("runs", "offsets", "pixels", "mean", "cov", "max_iou", "overlap"))
+
+    def dense_nbytes(self, image_shape):
+        # What keeping one full-resolution bool mask per instance would cost
+        return len(self) * int(image_shape[0]) * int(image_shape[1])
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, shape=np.array(self.shape), scale=np.array(self.scale),
+                 union_pixels=np.array(self.union_pixels), seconds=np.array(self.seconds),
+                 **{attr: getattr(self, attr) for attr in
+                    ("runs", "offsets", "pixels", "mean", "cov", "max_iou", "overlap")})
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        arrays = np.load(io.BytesIO(data))
+        masks = cls.__new__(cls)
+        masks.shape = tuple(int(v) for v in arrays["shape"])
+        masks.scale = tuple(float(v) for v in arrays["scale"])
+        masks.union_pixels = int(arrays["union_pixels"])
+        masks.seconds = float(arrays["seconds"])
+        for attr in ("runs", "offsets", "pixels", "mean", "cov", "max_iou", "overlap"):
+            setattr(masks, attr, arrays[attr])
+        return masks
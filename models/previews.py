@@ -0,0 +1,98 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from models.cache import ResultCache
+from models.config import (OVERLAY_SIZE, PREVIEW_CACHE_SIZE, PREVIEW_QUALITY,
+                           PREVIEW_WORKERS, THUMBNAIL_SIZE)
+from models.ingest import decode_bytes, file_name_of, read_buffer
+from models.inference import upload_hash
+from models.tracing import span
+
+# JPEG bytes keyed by content hash and size; memory only, they are cheap to
+# rebuild. cv2 releases the GIL while decoding and encoding, so a thread pool
+# builds a page's previews in parallel.
+preview_cache = ResultCache(PREVIEW_CACHE_SIZE, disk_dir=None)
+_pool = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="bioscan-preview")
+
+
+def _downscale(image, max_side):
+    import cv2
+
+    h, w = image.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    if scale < 1.0:
+        image = cv2.resize(image, (round(w * scale), round(h * scale)),
+                           interpolation=cv2.INTER_AREA)
+    return image
+
+
+def _encode(image):
+    import cv2
+
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_QUALITY])
+    if not ok:
+        raise ValueError("Could not encode preview")
+    return encoded.tobytes()
+
+
+def thumbnail(uploaded_file, max_side=THUMBNAIL_SIZE):
+    key = preview_cache.key(upload_hash(uploaded_file), "thumbnail", {"size": max_side})
+    cached = preview_cache.get(key)
+    if cached is not None:
+        return cached
+    name = file_name_of(uploaded_file)
+    image = decode_bytes(read_buffer(uploaded_file), name, max_side=max_side)
+    preview = _encode(_downscale(image, max_side))
+    preview_cache.put(key, preview)
+    return preview
+
+
+def overlay(uploaded_file, record, max_side=OVERLAY_SIZE):
+    # Detections drawn on a downscaled copy; the boxes are scaled rather than
+    # the rendered full-size image
+    digest = hashlib.blake2b(record.cls.tobytes() + record.boxes.tobytes(),
+                             digest_size=8).hexdigest()
+    key = preview_cache.key(upload_hash(uploaded_file), "overlay",
+                            {"size": max_side, "detections": digest})
+    cached = preview_cache.get(key)
+    if cached is not None:
+        return cached
+    image = decode_bytes(read_buffer(uploaded_file), file_name_of(uploaded_file),
+                         max_side=max_side)
+    image = _downscale(image, max_side)
+    scale = image.shape[1] / record.image_shape[1]
+    preview = _encode(record.scaled(scale).render(image))
+    preview_cache.put(key, preview)
+    return preview
+
+
+def _map(fn, items):
+    # Unreadable images get no preview rather than failing the whole page;
+    # the detection job reports them
+    def safe(item):
+        try:
+            return fn(*item)
+        except ValueError:
+            return None
+
+    return list(_pool.map(safe, items))
+
+
+def thumbnails(uploaded_files, max_side=THUMBNAIL_SIZE):
+    # (preview bytes, file name) pairs, ready for st.image(images, caption=names)
+    with span("previews.thumbnails", images=len(uploaded_files)):
+        previews = _map(thumbnail, [(f, max_side) for f in uploaded_files])
+    return [(preview, file_name_of(f)) for preview, f in zip(previews, uploaded_files)
+            if preview is not None]
+
+
+def overlays(uploaded_files, records, max_side=OVERLAY_SIZE):
+    # Same pairs, for every record whose upload is still present. Records are
+    # matched to uploads by content hash (Detections.digest), not by name,
+    # which two different images may share.
+    files_by_digest = {upload_hash(f): f for f in uploaded_files}
+    pairs = [(files_by_digest[r.digest], r) for r in records if r.digest in files_by_digest]
+    with span("previews.overlays", images=len(pairs)):
+        previews = _map(overlay, [(f, r, max_side) for f, r in pairs])
+    return [(preview, r.file_name) for preview, (_, r) in zip(previews, pairs)
+            if preview is not None]
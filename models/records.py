@@ -0,0 +1,181 @@
+import numpy as np
+
+# BGR colours cycled per class id when drawing boxes
+_COLORS = [(56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255),
+           (49, 210, 207), (10, 249, 72), (23, 204, 146), (134, 219, 61)]
+
+
+class Detections:
+    # Array-backed replacement for Ultralytics Results: a few small arrays per
+    # image instead of the original image, tensors and masks.
+    __slots__ = ("file_name", "cls", "conf", "boxes", "image_shape", "names",
+                 "mask_area", "profile", "masks", "digest")
+
+    def __init__(self, file_name, cls, conf, boxes, image_shape, names=None,
+                 mask_area=None, profile=None, masks=None, digest=None):
+        self.file_name = file_name
+        self.cls = np.asarray(cls, dtype=np.int64)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.image_shape = tuple(image_shape)
+        self.names = dict(names or {})
+        self.mask_area = None if mask_area is None else np.asarray(
+            mask_area, dtype=np.float32)
+        self.profile = profile
+        # models.masks.MaskSet for segmentation results; mask_area then
+        # holds its areas
+        self.masks = masks
+        # Content hash of the source image, set by run_batch and analyze_smear;
+        # unlike file_name it tells apart different images with one name
+        self.digest = digest
+
+    @classmethod
+    def from_result(cls, file_name, result, profile=None):
+        image_shape = result.orig_shape
+        if result.boxes is None or len(result.boxes) == 0:
+            return cls(file_name, [], [], np.empty((0, 4)), image_shape,
+                       result.names, profile=profile)
+
+        # boxes.data is (N, 6) [x1, y1, x2, y2, conf, cls], or (N, 7) with a
+        # track id, so one device-to-host copy brings everything across.
+        data = result.boxes.data.cpu().numpy()
+        masks = mask_area = None
+        if getattr(result, "masks", None) is not None:
+            from models.masks import MaskSet
+
+            masks = MaskSet.from_result(result.masks.data, image_shape, data[:, :4])
+            mask_area = masks.areas()
+        return cls(file_name, data[:, -1], data[:, -2], data[:, :4],
+                   image_shape, result.names, mask_area, profile, masks)
+
+    def __setstate__(self, state):
+        # Records pickled to the disk cache before a slot existed load with
+        # its default
+        self.masks = None
+        self.digest = None
+        for attr, value in state[1].items():
+            setattr(self, attr, value)
+
+    def with_file_name(self, file_name, digest=None):
+        # Cached records are shared between uploads of the same image; the
+        # arrays are never modified in place so only the name needs copying.
+        record = Detections.__new__(Detections)
+        for attr in self.__slots__:
+            setattr(record, attr, getattr(self, attr))
+        record.file_name = file_name
+        if digest is not None:
+            record.digest = digest
+        return record
+
+    def scaled(self, factor):
+        # Same detections on the image resized by `factor`, e.g. a preview
+        record = self.with_file_name(self.file_name)
+        record.boxes = self.boxes * np.float32(factor)
+        record.image_shape = tuple(round(side * factor) for side in self.image_shape[:2])
+        if self.mask_area is not None:
+            record.mask_area = self.mask_area * np.float32(factor ** 2)
+        if self.masks is not None:
+            record.masks = self.masks.scaled(factor)
+        return record
+
+    def __len__(self):
+        return len(self.cls)
+
+    def filter(self, min_conf=None, classes=None):
+        keep = np.ones(len(self), dtype=bool)
+        if min_conf is not None:
+            keep &= self.conf >= min_conf
+        if classes is not None:
+            keep &= np.isin(self.cls, list(classes))
+        record = self.with_file_name(self.file_name)
+        record.cls = self.cls[keep]
+        record.conf = self.conf[keep]
+        record.boxes = self.boxes[keep]
+        if self.mask_area is not None:
+            record.mask_area = self.mask_area[keep]
+        if self.masks is not None and not keep.all():
+            record.masks = self.masks.subset(keep, record.boxes)
+        return record
+
+    def counts(self, minlength=0):
+        return np.bincount(self.cls, minlength=minlength)
+
+    def class_stats(self, minlength=0):
+        counts = self.counts(minlength)
+        conf_sum = np.bincount(self.cls, weights=self.conf, minlength=counts.size)
+        mean_conf = np.divide(conf_sum, counts, out=np.zeros(counts.size),
+                              where=counts > 0)
+        return {int(cls_id): {"count": int(counts[cls_id]),
+                              "mean_conf": float(mean_conf[cls_id])}
+                for cls_id in np.flatnonzero(counts)}
+
+    def rounded_conf(self, decimals=4, mask=None):
+        conf = self.conf if mask is None else self.conf[mask]
+        return np.round(conf.astype(np.float64), decimals).tolist()
+
+    def to_dict(self, decimals=4):
+        detections = [
+            {"class_id": int(cls_id), "class": self.names.get(int(cls_id), str(cls_id)),
+             "confidence": conf, "box": box}
+            for cls_id, conf, box in zip(self.cls, self.rounded_conf(decimals),
+                                         np.round(self.boxes, 1).tolist())]
+        if self.mask_area is not None:
+            for detection, area in zip(detections, self.mask_area.tolist()):
+                detection["mask_area"] = round(area, 1)
+        if self.masks is not None:
+            for detection, lesion in zip(detections, self.lesions()):
+                detection["lesion"] = lesion
+        return {"file_name": self.file_name, "profile": self.profile,
+                "image_shape": list(self.image_shape),
+                "counts": {self.names.get(cls_id, str(cls_id)): stats["count"]
+                           for cls_id, stats in self.class_stats().items()},
+                "detections": detections}
+
+    def lesions(self, decimals=1):
+        # One dict of mask measurements (image pixels) per detection
+        if self.masks is None:
+            return []
+        metrics = self.masks.metrics()
+        rounded = {key: np.round(np.asarray(values, dtype=np.float64), decimals).tolist()
+                   for key, values in metrics.items() if key not in ("max_iou", "overlap")}
+        overlap = {key: np.round(metrics[key].astype(np.float64), 3).tolist()
+                   for key in ("max_iou", "overlap")}
+        return [{"area": rounded["area"][i],
+                 "equivalent_diameter": rounded["equivalent_diameter"][i],
+                 "ellipse": {"center": rounded["center"][i],
+                             "major_axis": rounded["major_axis"][i],
+                             "minor_axis": rounded["minor_axis"][i],
+                             "angle": rounded["angle"][i]},
+                 "max_iou": overlap["max_iou"][i],
+                 "overlap": overlap["overlap"][i]}
+                for i in range(len(self))]
+
+    @property
+    def nbytes(self):
+        arrays = (self.cls, self.conf, self.boxes, self.mask_area, self.masks)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def render(self, image, line_width=None):
+        import cv2
+
+        annotated = image.copy()
+        line_width = line_width or max(1, round(sum(image.shape[:2]) / 600))
+        if self.masks is not None and len(self.masks):
+            # The run-length masks are only expanded here, as one label map
+            # at mask resolution resized straight to the output size
+            labels = cv2.resize(self.masks.label_map(), (image.shape[1], image.shape[0]),
+                                interpolation=cv2.INTER_NEAREST)
+            colors = np.array([(0, 0, 0)] + [_COLORS[c % len(_COLORS)] for c in self.cls],
+                              dtype=np.float32)
+            covered = labels > 0
+            annotated[covered] = (0.6 * annotated[covered]
+                                  + 0.4 * colors[labels[covered]]).astype(annotated.dtype)
+        for cls_id, conf, (x1, y1, x2, y2) in zip(self.cls, self.conf,
+                                                  self.boxes.astype(int)):
+            color = _COLORS[cls_id % len(_COLORS)]
+            label = f"{self.names.get(int(cls_id), cls_id)} {conf:.2f}"
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, line_width)
+            cv2.putText(annotated, label, (x1, max(y1 - 4, 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, line_width / 3, color,
+                        max(1, line_width // 2), cv2.LINE_AA)
+        return annotated
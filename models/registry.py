@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+from models.backends import backend_label, base_model
+from models.config import CASCADE_MODELS, CASCADES, MODEL_PATHS, MODEL_VARIANTS, TRAIN_IMGSZ
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Models live in module globals so a single copy is shared by every Streamlit
+# session and page running in this process; nothing is loaded until the first
+# get_model() call for that name.
+_models = {}
+_stats = {}
+_locks = {name: threading.Lock() for name in [*MODEL_PATHS, *MODEL_VARIANTS]}
+_warmup_lock = threading.Lock()
+_warmup_started = set()
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _load_yolo(name):
+    from models.backends import load_detector
+    return load_detector(name)
+
+
+def _load_ann(name):
+    from models.breast_cancer_model import load_classifier
+    return load_classifier()
+
+
+def _warm_yolo(name, model):
+    import numpy as np
+    imgsz = TRAIN_IMGSZ[base_model(name)]
+    model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz,
+                  verbose=False)
+
+
+def _warm_ann(name, model):
+    import numpy as np
+    model.predict(np.zeros((1, model.mean.size)))
+
+
+_LOADERS = {
+    "blood_cells": (_load_yolo, _warm_yolo),
+    "malarial_cells": (_load_yolo, _warm_yolo),
+    "breast_cancer": (_load_yolo, _warm_yolo),
+    "breast_cancer_ann": (_load_ann, _warm_ann),
+    **{name: (_load_yolo, _warm_yolo) for name in MODEL_VARIANTS},
+}
+
+# Ultralytics keeps per-call state (the predictor, its batch and results) on
+# the model, so predict calls on one shared instance must not overlap. Jobs,
+# the smear pipeline and warm-up each hold the model's lock while predicting.
+_predict_locks = {name: threading.Lock() for name in _LOADERS}
+
+
+def get_model(name):
+    if name not in _LOADERS:
+        raise ValueError(f"Unknown model: {name}")
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _locks[name]:
+        if name not in _models:
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            _models[name] = _LOADERS[name][0](name)
+            rss_after = _rss_bytes()
+            _stats[name] = {
+                "backend": backend_label(name),
+                "load_seconds": round(time.perf_counter() - start, 3),
+                "rss_delta_mb": round((rss_after - rss_before) / 2**20, 1),
+                "rss_after_mb": round(rss_after / 2**20, 1),
+                "warmup_seconds": None,
+            }
+    return _models[name]
+
+
+def predict_lock(name):
+    if name not in _predict_locks:
+        raise ValueError(f"Unknown model: {name}")
+    return _predict_locks[name]
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def _warm(names):
+    for name in names:
+        try:
+            model = get_model(name)
+            start = time.perf_counter()
+            with _predict_locks[name]:
+                _LOADERS[name][1](name, model)
+            _stats[name]["warmup_seconds"] = round(
+                time.perf_counter() - start, 3)
+        except Exception as e:
+            _stats.setdefault(name, {})["error"] = str(e)
+
+
+def warm_up(names=None, background=True):
+    if names is None or "all" in names:
+        # Variants only when an enabled cascade uses them
+        names = list(MODEL_PATHS) + [stage for model_id in CASCADE_MODELS
+                                     for stage in (CASCADES[model_id]["small"],
+                                                   CASCADES[model_id]["large"])
+                                     if stage not in MODEL_PATHS]
+    with _warmup_lock:
+        names = [name for name in names if name not in _warmup_started]
+        _warmup_started.update(names)
+    if not names:
+        return None
+
+    if not background:
+        _warm(names)
+        return None
+    thread = threading.Thread(target=_warm, args=(names,),
+                              name="bioscan-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def model_stats():
+    return {name: dict(stats) for name, stats in _stats.items()}
@@ -0,0 +1,91 @@
+import math
+from statistics import NormalDist
+
+from models.config import EARLY_STOP_MIN_IMAGES, SAMPLING_CONFIDENCE
+
+
+def wilson_interval(successes, total, confidence=SAMPLING_CONFIDENCE):
+    # Score interval for a proportion; unlike the normal approximation it
+    # stays inside [0, 1] and behaves with few or zero successes
+    if total <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / total
+    denominator = 1 + z * z / total
+    centre = (p + z * z / (2 * total)) / denominator
+    half = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def _odds(p):
+    return p / (1 - p) if p < 1 else float("inf")
+
+
+class RunningProportion:
+    # Totals of two cell classes over images as they arrive, e.g. infected vs
+    # uninfected or RBC vs WBC. The interval is on the share of `successes`;
+    # the ratio interval (successes / failures) follows from it because the
+    # ratio is monotone in the share.
+    def __init__(self, confidence=SAMPLING_CONFIDENCE):
+        self.confidence = confidence
+        self.images = 0
+        self.successes = 0
+        self.failures = 0
+
+    def add(self, successes, failures, weight=1):
+        self.images += 1
+        self.successes += successes * weight
+        self.failures += failures * weight
+        return self
+
+    @property
+    def total(self):
+        return self.successes + self.failures
+
+    @property
+    def share(self):
+        return self.successes / self.total if self.total else 0.0
+
+    @property
+    def interval(self):
+        return wilson_interval(self.successes, self.total, self.confidence)
+
+    @property
+    def ratio_interval(self):
+        low, high = self.interval
+        return _odds(low), _odds(high)
+
+    @property
+    def width(self):
+        low, high = self.interval
+        return high - low
+
+    def settled(self, tolerance, min_images=EARLY_STOP_MIN_IMAGES):
+        return self.images >= min_images and self.total > 0 and self.width <= tolerance
+
+
+def stop_when_settled(counts, tolerance, min_images=EARLY_STOP_MIN_IMAGES,
+                      confidence=SAMPLING_CONFIDENCE):
+    # Early-stop check for JobManager.submit: counts(output) -> (successes,
+    # failures) for one image's output. Every distinct image counts once here,
+    # copies add no information.
+    def settled(outputs):
+        running = RunningProportion(confidence)
+        for output in outputs:
+            running.add(*counts(output))
+        return running.settled(tolerance, min_images)
+
+    return settled
+
+
+def describe_interval(running, tolerance=None, percent=True):
+    low, high = running.interval
+    if percent:
+        text = f"{low * 100:.1f}–{high * 100:.1f}%"
+    else:
+        low, high = running.ratio_interval
+        text = f"{low:.2f}–{'∞' if math.isinf(high) else f'{high:.2f}'}"
+    text = f"{running.confidence:.0%} interval {text} after {running.images} image(s)"
+    if tolerance is not None:
+        text += f", width {running.width:.3f} (stops at {tolerance:.3f})"
+    return text
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from models.blood_cells_model import check_ratio
+from models.cache import result_cache
+from models.config import BATCH_SIZE
+from models.history import history_store
+from models.inference import (cache_key, model_version, predict_images, resolve_profile,
+                              upload_hash)
+from models.ingest import batched, check_image_count, decode_image, file_name_of
+from models.malarial_cells_model import check_malaria_status
+from models.tracing import activate, current, span
+
+SMEAR_MODELS = ("blood_cells", "malarial_cells")
+
+
+def _predict(model_id, profile, items, batch_size, trace=None):
+    # The same predict_images path run_detection_batch takes (Ultralytics'
+    # own letterbox, tiling, cascades), so records cached under cache_key are
+    # identical whichever page produced them
+    with activate(trace):
+        records = predict_images(model_id, [(name, image) for _, name, image in items],
+                                 profile, batch_size)
+    return {index: record for (index, _, _), record in zip(items, records)}
+
+
+def analyze_smear(uploaded_files, profile=None, batch_size=BATCH_SIZE, errors=None, weights=None,
+                  sample=None):
+    # Decode each smear once and run the RBC/WBC and malaria detectors on the
+    # decoded image concurrently. Each model still does its own resizing: the
+    # profiles train them at different input sizes.
+    check_image_count(uploaded_files)
+    settings = {model_id: resolve_profile(model_id, profile) for model_id in SMEAR_MODELS}
+    versions = {model_id: model_version(model_id, params)
+                for model_id, (_, params) in settings.items()}
+
+    records = {model_id: [None] * len(uploaded_files) for model_id in SMEAR_MODELS}
+    keys = {}
+    digests = [upload_hash(uploaded_file) for uploaded_file in uploaded_files]
+    pending = []
+    for index, uploaded_file in enumerate(uploaded_files):
+        for model_id, (model_profile, params) in settings.items():
+            keys[model_id, index] = cache_key(model_id, digests[index], params)
+            cached = result_cache.get(keys[model_id, index])
+            if cached is None:
+                cached = history_store.get(digests[index], model_id, versions[model_id],
+                                           model_profile)
+                if cached is not None:
+                    result_cache.put(keys[model_id, index], cached)
+            if cached is not None:
+                records[model_id][index] = cached.with_file_name(file_name_of(uploaded_file),
+                                                                 digests[index])
+        if any(records[model_id][index] is None for model_id in SMEAR_MODELS):
+            pending.append((index, uploaded_file))
+
+    with ThreadPoolExecutor(max_workers=len(SMEAR_MODELS),
+                            thread_name_prefix="bioscan-smear") as pool:
+        for batch in batched(pending, batch_size):
+            decoded = []
+            for index, uploaded_file in batch:
+                try:
+                    with span("decode", image=file_name_of(uploaded_file)):
+                        image = decode_image(uploaded_file)
+                    decoded.append((index, file_name_of(uploaded_file), image))
+                except ValueError as e:
+                    if errors is None:
+                        raise
+                    errors.append((file_name_of(uploaded_file), str(e)))
+
+            futures = {}
+            for model_id, (model_profile, _) in settings.items():
+                items = [item for item in decoded if records[model_id][item[0]] is None]
+                if items:
+                    futures[model_id] = pool.submit(_predict, model_id, model_profile, items,
+                                                    batch_size, current())
+
+            for model_id, future in futures.items():
+                for index, record in future.result().items():
+                    record.digest = digests[index]
+                    records[model_id][index] = record
+                    result_cache.put(keys[model_id, index], record)
+
+    with span("history"):
+        for model_id, (model_profile, _) in settings.items():
+            history_store.record(model_id, versions[model_id], model_profile,
+                                 [(digest, record) for digest, record in zip(digests, records[model_id])
+                                  if record is not None], sample)
+    return smear_report(records["blood_cells"], records["malarial_cells"], weights)
+
+
+def smear_report(blood_records, malaria_records, weights=None):
+    # weights: optional {content hash: times counted in the totals}, e.g.
+    # copies from models.dedup
+    weights = weights or {}
+    images, counted = [], []
+    for blood, malaria in zip(blood_records, malaria_records):
+        if blood is None or malaria is None:
+            continue
+        rbc, wbc = blood.counts(minlength=2)[:2]
+        infected = int(np.count_nonzero(malaria.cls == 0))
+        images.append({"File Name": blood.file_name, "RBC": int(rbc), "WBC": int(wbc),
+                       "Infected": infected, "Uninfected": len(malaria) - infected})
+        counted.append(weights.get(blood.digest, 1))
+
+    totals = {column: sum(row[column] * weight for row, weight in zip(images, counted))
+              for column in ("RBC", "WBC", "Infected", "Uninfected")}
+    ratio = totals["RBC"] / totals["WBC"] if totals["WBC"] else float("inf")
+    malaria_status = check_malaria_status(totals["Infected"], totals["Uninfected"])
+    return {
+        "images": images,
+        "totals": totals,
+        "ratio": ratio,
+        "ratio_status": check_ratio(ratio),
+        "malaria_status": malaria_status[0],
+        "infection_percent": malaria_status[1],
+    }
@@ -0,0 +1,97 @@
+import itertools
+
+import numpy as np
+
+from models.config import BATCH_SIZE, TILED_MODELS, TILE_OVERLAP, TILE_TRIGGER
+from models.records import Detections
+
+
+def needs_tiling(model_id, image, imgsz):
+    return model_id in TILED_MODELS and max(image.shape[:2]) > TILE_TRIGGER * imgsz
+
+
+def tile_origins(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    return list(range(0, length - tile, stride)) + [length - tile]
+
+
+def iter_tiles(image, tile, overlap):
+    # Tiles are views into the decoded image, so no tile is copied before its
+    # batch is predicted. The image itself is decoded whole, which
+    # MAX_IMAGE_PIXELS bounds.
+    h, w = image.shape[:2]
+    for y in tile_origins(h, tile, overlap):
+        for x in tile_origins(w, tile, overlap):
+            yield x, y, image[y:y + tile, x:x + tile]
+
+
+def _inner_edge_mask(boxes, x, y, tile_shape, image_shape, margin):
+    # Boxes touching a tile edge that is not also an image edge are cut-off
+    # cells; the overlap guarantees a neighbouring tile sees them whole.
+    th, tw = tile_shape[:2]
+    h, w = image_shape[:2]
+    keep = np.ones(len(boxes), dtype=bool)
+    if x > 0:
+        keep &= boxes[:, 0] > margin
+    if x + tw < w:
+        keep &= boxes[:, 2] < tw - margin
+    if y > 0:
+        keep &= boxes[:, 1] > margin
+    if y + th < h:
+        keep &= boxes[:, 3] < th - margin
+    return keep
+
+
+def nms(boxes, scores, classes, iou_threshold):
+    # Class-aware NMS: shifting each class into its own coordinate range keeps
+    # boxes of different classes from suppressing each other.
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    shifted = boxes + (classes[:, None] * (boxes.max() + 1)).astype(boxes.dtype)
+    x1, y1, x2, y2 = shifted.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def detect_tiled(model, image, file_name, params, batch_size=BATCH_SIZE,
+                 overlap=TILE_OVERLAP, profile=None, edge_margin=2):
+    # Callers hold the model's models.registry.predict_lock
+    tile = params["imgsz"]
+    tiles = iter_tiles(image, tile, int(tile * overlap))
+
+    boxes, conf, cls = [], [], []
+    names = None
+    while True:
+        chunk = list(itertools.islice(tiles, batch_size))
+        if not chunk:
+            break
+        results = model.predict([t for _, _, t in chunk], verbose=False, **params)
+        for (x, y, t), result in zip(chunk, results):
+            record = Detections.from_result(file_name, result)
+            names = record.names
+            keep = _inner_edge_mask(record.boxes, x, y, t.shape, image.shape,
+                                    edge_margin)
+            boxes.append(record.boxes[keep] + np.array([x, y, x, y], dtype=np.float32))
+            conf.append(record.conf[keep])
+            cls.append(record.cls[keep])
+
+    boxes = np.concatenate(boxes) if boxes else np.empty((0, 4), dtype=np.float32)
+    conf = np.concatenate(conf) if conf else np.empty(0, dtype=np.float32)
+    cls = np.concatenate(cls) if cls else np.empty(0, dtype=np.int64)
+    keep = nms(boxes, conf, cls, params.get("iou", 0.7))
+    return Detections(file_name, cls[keep], conf[keep], boxes[keep],
+                      image.shape[:2], names, profile=profile)
@@ -0,0 +1,184 @@
+import contextlib
+import io
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+from models.config import PROFILER, TRACE_HISTORY, TRACE_LOG
+
+logger = logging.getLogger("bioscan.trace")
+
+# Spans are attached to the trace active on the current thread, if any, and
+# always added to the process-wide per-stage totals that /metrics exposes.
+_local = threading.local()
+_recent = deque(maxlen=TRACE_HISTORY)
+_totals = {}
+_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.started = time.time()
+        self.seconds = None
+        self.spans = []
+        self.profile = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, start, seconds, depth=0, attrs=None):
+        with self._lock:
+            self.spans.append({"name": name, "depth": depth,
+                               "start_ms": round((start - self._start) * 1000, 2),
+                               "ms": round(seconds * 1000, 2), **(attrs or {})})
+
+    def stages(self):
+        # Per-stage call count and total time, in first-seen order
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(span["name"], {"stage": span["name"], "calls": 0, "ms": 0.0})
+            stage["calls"] += 1
+            stage["ms"] = round(stage["ms"] + span["ms"], 2)
+        return list(stages.values())
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {"id": self.id, "name": self.name, "started": self.started,
+                "ms": None if self.seconds is None else round(self.seconds * 1000, 2),
+                "spans": spans}
+
+
+def current():
+    return getattr(_local, "trace", None)
+
+
+@contextlib.contextmanager
+def activate(trace):
+    # Attach spans recorded on this thread to `trace`, e.g. in pool workers
+    previous, previous_depth = current(), getattr(_local, "depth", 0)
+    _local.trace, _local.depth = trace, 0
+    try:
+        yield trace
+    finally:
+        _local.trace, _local.depth = previous, previous_depth
+
+
+def record(name, seconds, start=None, **attrs):
+    with _lock:
+        count, total = _totals.get(name, (0, 0.0))
+        _totals[name] = (count + 1, total + seconds)
+    trace = current()
+    if trace is not None:
+        start = time.perf_counter() - seconds if start is None else start
+        trace.add(name, start, seconds, getattr(_local, "depth", 0), attrs)
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        record(name, time.perf_counter() - start, start, **attrs)
+
+
+def record_speed(names, results):
+    # Ultralytics times preprocess/inference/postprocess per image (in ms)
+    for name, result in zip(names, results):
+        for stage, ms in (getattr(result, "speed", None) or {}).items():
+            if ms is not None:
+                record(f"yolo.{stage}", ms / 1000, image=name)
+
+
+class _Profiler:
+    def __init__(self, kind):
+        self.kind = kind
+        if kind == "pyinstrument":
+            from pyinstrument import Profiler
+            self._profiler = Profiler()
+        else:
+            import cProfile
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+            return self._profiler.output_text()
+        import pstats
+
+        self._profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(30)
+        return out.getvalue()
+
+
+def start_trace(name, profiler=PROFILER):
+    trace = Trace(name)
+    trace._previous = (current(), getattr(_local, "depth", 0))
+    trace._profiler = _Profiler(profiler) if profiler else None
+    _local.trace, _local.depth = trace, 0
+    if trace._profiler is not None:
+        trace._profiler.start()
+    return trace
+
+
+def finish_trace(trace):
+    if trace.seconds is not None:
+        return trace
+    if trace._profiler is not None:
+        trace.profile = trace._profiler.stop()
+    trace.seconds = time.perf_counter() - trace._start
+    _local.trace, _local.depth = trace._previous
+    with _lock:
+        _recent.append(trace)
+    if TRACE_LOG:
+        logger.info(json.dumps({"trace": trace.name, "id": trace.id,
+                                "ms": round(trace.seconds * 1000, 2),
+                                "stages": trace.stages()}))
+    return trace
+
+
+@contextlib.contextmanager
+def trace(name, profiler=PROFILER):
+    active = start_trace(name, profiler)
+    try:
+        yield active
+    finally:
+        finish_trace(active)
+
+
+def recent_traces(prefix=None):
+    with _lock:
+        traces = list(_recent)
+    return [t for t in reversed(traces) if prefix is None or t.name.startswith(prefix)]
+
+
+def stage_totals():
+    with _lock:
+        return {name: {"count": count, "seconds": round(total, 6)}
+                for name, (count, total) in _totals.items()}
+
+
+def prometheus_lines():
+    lines = ["# TYPE bioscan_stage_calls_total counter",
+             "# TYPE bioscan_stage_seconds_total counter"]
+    for name, stats in sorted(stage_totals().items()):
+        lines.append(f'bioscan_stage_calls_total{{stage="{name}"}} {stats["count"]}')
+        lines.append(f'bioscan_stage_seconds_total{{stage="{name}"}} {stats["seconds"]:.6f}')
+    return lines
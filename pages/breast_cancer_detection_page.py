@@ -1,7 +1,15 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-from models.breast_cancer_model import run_detection, run_classification
+import time
+import functools
+from models.jobs import job_manager, job_key, JobQueueFull
+from models.breast_cancer_model import (run_detection_batch, run_classification, score_file, FEATURE_COLUMNS,
+                                        lesion_rows, mask_footprint)
+from models.inference import describe_profile
+from models.tracing import span
+from models.config import MAX_IMAGES
+from models.previews import overlays, thumbnails
+from models.dedup import deduplicate, describe_duplicates, duplicate_weights
 
 st.title("Breast Cancer Detection")
 
@@ -77,31 +85,84 @@ with st.expander("What to Expect", expanded=False):
 st.header("📤 Upload Breast Ultrasound Images")
 uploaded_files = st.file_uploader(
     "Choose a file", type=["jpg", "png", "jpeg"], accept_multiple_files=True)
+profile = st.session_state.get("inference_profile")
+
+if len(uploaded_files) > MAX_IMAGES:
+    st.error(
+        f"At most {MAX_IMAGES} images can be analyzed at once; only the first {MAX_IMAGES} will be used.")
+    uploaded_files = uploaded_files[:MAX_IMAGES]
+
+dedup = deduplicate(uploaded_files, near=st.session_state.get("dedup_near", False))
+count_duplicates = st.session_state.get("count_duplicates", False)
+weights = duplicate_weights(dedup, count_duplicates)
+sample = (st.session_state.get("sample_id") or "").strip() or None
 
 file_names = []
 malignant_count = 0
 benign_count = 0
 net_conf = []
+records = []
+job = None
 
 if len(uploaded_files) > 0:
-    st.image(uploaded_files, width=275, caption=[
-             file.name for file in uploaded_files])
+    with span("render.uploads", images=len(uploaded_files)):
+        previews = thumbnails(uploaded_files)
+        if previews:
+            st.image([image for image, _ in previews], width=275,
+                     caption=[name for _, name in previews])
     st.success(f"{len(uploaded_files)} file(s) uploaded successfully!")
-    for file in uploaded_files:
-        file_name, conf, benign, malignant = run_detection(file)
-        file_names.append(file_name)
-        benign_count += len(benign)
-        malignant_count += len(malignant)
-        net_conf.append(conf)
+    if describe_duplicates(dedup, count_duplicates):
+        st.info(describe_duplicates(dedup, count_duplicates))
+    try:
+        job = job_manager.submit(job_key("breast_cancer", dedup["unique"], st.session_state.get("session_id"), profile=profile, sample=sample),
+                                 functools.partial(run_detection_batch, profile=profile, sample=sample), dedup["unique"],
+                                 name="breast_cancer")
+    except JobQueueFull as e:
+        st.error(str(e))
+    else:
+        if job.status == "failed":
+            st.error(f"Detection failed: {job.error}")
+        elif not job.finished:
+            st.progress(job.progress, text=f"Analyzing images... {job.completed}/{job.total}")
+        outputs, errors = job.snapshot()
+        for file_name, conf, benign, malignant, record in outputs:
+            file_names.append(file_name)
+            records.append(record)
+            weight = weights.get(record.digest, 1)
+            benign_count += len(benign) * weight
+            malignant_count += len(malignant) * weight
+            net_conf.append(conf)
+        for _, message in errors:
+            st.warning(message)
 else:
     st.info("Please upload one or more breast ultrasound images for AI-based analysis.")
 
 st.subheader("Detection Results", divider="blue")
+st.caption(f"Inference profile: {describe_profile('breast_cancer', profile)}")
 if len(uploaded_files) > 0:
-    st.bar_chart(pd.DataFrame([benign_count, malignant_count], columns=[
-                 'Count'], index=['Benign', 'Malignant']))
-    summary_df = pd.DataFrame({"Image": file_names, "Confidence": net_conf})
-    st.line_chart(summary_df, x="Image", y="Confidence")
+    import pandas as pd
+
+    with span("render.charts"):
+        st.bar_chart(pd.DataFrame([benign_count, malignant_count], columns=[
+                     'Count'], index=['Benign', 'Malignant']))
+        summary_df = pd.DataFrame({"Image": file_names, "Confidence": net_conf})
+        st.line_chart(summary_df, x="Image", y="Confidence")
+
+    lesions = [row for record in records for row in lesion_rows(record)]
+    if lesions:
+        st.subheader("Lesion Measurements")
+        st.dataframe(lesions, hide_index=True)
+        footprints = [f for f in (mask_footprint(record) for record in records) if f]
+        with st.expander("Mask memory and time per image", expanded=False):
+            st.dataframe(footprints, hide_index=True)
+
+    # Masks are kept run-length encoded and only drawn when asked for
+    if records and st.toggle("Show lesion masks"):
+        with span("render.overlays", images=len(records)):
+            annotated = overlays(uploaded_files, records)
+            if annotated:
+                st.image([image for image, _ in annotated], width=275,
+                         caption=[name for _, name in annotated])
 else:
     st.warning(
         "Please upload valid breast ultrasound images with detectable tissue regions.")
@@ -112,14 +173,7 @@ st.markdown(
 
 with st.form("ann_input_form"):
     cols = st.columns(3)
-    input_fields = [
-        "radius_mean", "texture_mean", "perimeter_mean", "area_mean", "smoothness_mean",
-        "compactness_mean", "concavity_mean", "concave_points_mean", "symmetry_mean", "fractal_dimension_mean",
-        "radius_se", "texture_se", "perimeter_se", "area_se", "smoothness_se",
-        "compactness_se", "concavity_se", "concave_points_se", "symmetry_se", "fractal_dimension_se",
-        "radius_worst", "texture_worst", "perimeter_worst", "area_worst", "smoothness_worst",
-        "compactness_worst", "concavity_worst", "concave_points_worst", "symmetry_worst", "fractal_dimension_worst"
-    ]
+    input_fields = FEATURE_COLUMNS
 
     input_values = {}
     for i, field in enumerate(input_fields):
@@ -131,15 +185,52 @@ with st.form("ann_input_form"):
     if submitted:
         st.write("✅ Form submitted!")
         input_array = np.array([input_values[field] for field in input_fields])
-        result = run_classification(input_array)
-        if result == 1:
-            st.error("🔴 Predicted Tumor Type: Malignant")
-            st.warning(
-                "⚠️ Immediate medical consultation is recommended. This prediction is AI-based and for educational purposes only.")
+        try:
+            result = run_classification(input_array)
+        except FileNotFoundError as e:
+            st.error(f"ANN model files are missing: {e}")
         else:
-            st.info("🟢 Predicted Tumor Type: Benign")
-            st.warning(
-                "⚠️ Although classified as Benign, it is not guaranteed to be completely safe. Regular checkups and professional assessment are advised.")
+            if result == 1:
+                st.error("🔴 Predicted Tumor Type: Malignant")
+                st.warning(
+                    "⚠️ Immediate medical consultation is recommended. This prediction is AI-based and for educational purposes only.")
+            else:
+                st.info("🟢 Predicted Tumor Type: Benign")
+                st.warning(
+                    "⚠️ Although classified as Benign, it is not guaranteed to be completely safe. Regular checkups and professional assessment are advised.")
+
+st.header("📄 Batch Prediction")
+st.markdown(
+    "Upload a CSV or Parquet file with the same feature columns as `breast-cancer.csv` to score every row at once:")
+
+feature_file = st.file_uploader(
+    "Choose a feature table", type=["csv", "parquet"], key="ann_batch_file")
+
+if feature_file is not None:
+    # Scored once per upload; the reruns that poll the image job reuse it
+    scored = st.session_state.get("ann_batch_scores")
+    if scored is None or scored[0] != feature_file.file_id:
+        try:
+            start = time.perf_counter()
+            scored = (feature_file.file_id, score_file(feature_file),
+                      time.perf_counter() - start, None)
+        except (ValueError, FileNotFoundError, ImportError) as e:
+            scored = (feature_file.file_id, None, None, str(e))
+        st.session_state["ann_batch_scores"] = scored
+    _, scored_df, elapsed, error = scored
+    if error is not None:
+        st.error(f"Could not score {feature_file.name}: {error}")
+    else:
+        counts = scored_df["prediction"].value_counts()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Rows", len(scored_df))
+        col2.metric("Malignant", int(counts.get("Malignant", 0)))
+        col3.metric("Benign", int(counts.get("Benign", 0)))
+        st.caption(
+            f"Scored in {elapsed:.3f}s ({len(scored_df) / max(elapsed, 1e-9):,.0f} rows/s)")
+        st.dataframe(scored_df, hide_index=True)
+        st.download_button("Download Results", scored_df.to_csv(index=False),
+                           file_name="breast_cancer_predictions.csv", mime="text/csv")
 
 
 st.markdown("""
@@ -161,3 +252,8 @@ col1, col2 = st.columns([1, 1])
 with col1:
     if st.button("Previous Page", width="stretch"):
         st.switch_page("./pages/malarial_detection_page.py")
+
+# Poll the background job until every image is in
+if job is not None and not job.finished:
+    time.sleep(0.5)
+    st.rerun()
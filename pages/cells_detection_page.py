@@ -1,6 +1,15 @@
 import streamlit as st
-from models.blood_cells_model import run_detection, check_ratio
-import pandas as pd
+import functools
+import time
+from models.blood_cells_model import run_detection_batch, check_ratio, cell_counts
+from models.jobs import job_manager, job_key, JobQueueFull
+from models.inference import describe_profile
+from models.tracing import span
+from models.config import MAX_IMAGES, EARLY_STOP, EARLY_STOP_TOLERANCE
+from models.history import history_store
+from models.sampling import RunningProportion, describe_interval, stop_when_settled
+from models.previews import overlays, thumbnails
+from models.dedup import deduplicate, describe_duplicates, duplicate_weights
 
 
 st.title("Blood Cells Detection")
@@ -76,11 +85,27 @@ with st.expander("What to Expect", expanded=False):
 
 uploaded_files = st.file_uploader(
     "Choose a file", type=["jpg", "png", "jpeg"], accept_multiple_files=True)
+profile = st.session_state.get("inference_profile")
+
+if len(uploaded_files) > MAX_IMAGES:
+    st.error(
+        f"At most {MAX_IMAGES} images can be analyzed at once; only the first {MAX_IMAGES} will be used.")
+    uploaded_files = uploaded_files[:MAX_IMAGES]
+
+dedup = deduplicate(uploaded_files, near=st.session_state.get("dedup_near", False))
+count_duplicates = st.session_state.get("count_duplicates", False)
+weights = duplicate_weights(dedup, count_duplicates)
+sample = (st.session_state.get("sample_id") or "").strip() or None
+tolerance = EARLY_STOP_TOLERANCE["blood_cells"] if st.session_state.get(
+    "early_stop", EARLY_STOP) else None
 
 net_rbc_count = 0
 net_wbc_count = 0
 health_status = ""
 ratio = 0.0
+records = []
+running = RunningProportion()
+job = None
 
 
 def get_results():
@@ -89,37 +114,82 @@ def get_results():
     global net_wbc_count
     global health_status
     global ratio
+    global records
+    global running
+    global job
 
     net_rbc_count = 0
     net_wbc_count = 0
-
-    for file in uploaded_files:
-        results, rbc_count, wbc_count, ratio = run_detection(file)
-        net_rbc_count += rbc_count
-        net_wbc_count += wbc_count
+    records = []
+    running = RunningProportion()
+
+    try:
+        job = job_manager.submit(job_key("blood_cells", dedup["unique"], st.session_state.get("session_id"), profile=profile, early_stop=tolerance,
+                                         sample=sample),
+                                 functools.partial(run_detection_batch, profile=profile, sample=sample), dedup["unique"],
+                                 name="blood_cells",
+                                 stop_when=stop_when_settled(cell_counts, tolerance) if tolerance else None)
+    except JobQueueFull as e:
+        st.error(str(e))
+        return
+    if job.status == "failed":
+        st.error(f"Detection failed: {job.error}")
+    elif not job.finished:
+        st.progress(job.progress, text=f"Analyzing images... {job.completed}/{job.total}")
+
+    outputs, errors = job.snapshot()
+    for record, rbc_count, wbc_count, ratio in outputs:
+        records.append(record)
+        weight = weights.get(record.digest, 1)
+        net_rbc_count += rbc_count * weight
+        net_wbc_count += wbc_count * weight
+        running.add(rbc_count, wbc_count, weight)
+    for _, message in errors:
+        st.warning(message)
+    if job.stopped_early:
+        st.info(f"Stopped after {job.completed} of {job.total} images: the RBC/WBC ratio had settled.")
 
     ratio = net_rbc_count / \
         net_wbc_count if net_wbc_count != 0 else float('inf')
 
-    health_status = check_ratio(ratio=ratio)
+    # Statuses are judged on the interval, so a ratio near a threshold stays
+    # inconclusive until enough cells are in
+    health_status = check_ratio(ratio=ratio, interval=running.ratio_interval)
 
 
 if len(uploaded_files) > 0:
-    st.image(uploaded_files, width=300, caption=[
-             file.name for file in uploaded_files])
+    with span("render.uploads", images=len(uploaded_files)):
+        previews = thumbnails(uploaded_files)
+        if previews:
+            st.image([image for image, _ in previews], width=300,
+                     caption=[name for _, name in previews])
     st.success("Files uploaded successfully!")
+    if describe_duplicates(dedup, count_duplicates):
+        st.info(describe_duplicates(dedup, count_duplicates))
     get_results()
 else:
     st.info("Please upload at least one image file.")
 
 
 st.subheader("Detection Results", divider="blue")
+st.caption(f"Inference profile: {describe_profile('blood_cells', profile)}")
 
 
 if net_rbc_count > 0:
-    st.bar_chart(pd.DataFrame([net_rbc_count, net_wbc_count], columns=[
-                 'Count'], index=['RBC', 'WBC']))
+    import pandas as pd
+
+    with span("render.charts"):
+        st.bar_chart(pd.DataFrame([net_rbc_count, net_wbc_count], columns=[
+                     'Count'], index=['RBC', 'WBC']))
     st.markdown(r"$\frac{RBCs}{WBCs} = " + f"{ratio:.2f}$")
+    st.caption(describe_interval(running, tolerance, percent=False))
+
+    if st.toggle("Show detected cells"):
+        with span("render.overlays", images=len(records)):
+            annotated = overlays(uploaded_files, records)
+            if annotated:
+                st.image([image for image, _ in annotated], width=300,
+                         caption=[name for _, name in annotated])
 
     if health_status == "RBC/WBC ratio is within normal range. Sample shows a healthy distribution of blood cells.":
         st.success(health_status)
@@ -129,10 +199,26 @@ if net_rbc_count > 0:
         st.info(health_status)
     elif health_status == "No White Blood Cells (WBCs) detected. Unable to compute RBC:WBC ratio.":
         st.error(health_status)
+    elif health_status.startswith("Inconclusive"):
+        st.warning(health_status)
 
 
 else:
     st.warning("Please upload valid images with detectable blood cells.")
+
+with st.expander("History", expanded=False):
+    trend_by = st.radio("Trend by", ["image", "sample"], horizontal=True, key="cells_trend_by")
+    points = [point for point in history_store.trend("blood_cells", classes=(0, 1), by=trend_by)
+              if point["positive"] < point["total"]]
+    if points:
+        import pandas as pd
+
+        st.line_chart(pd.DataFrame({
+            "RBC/WBC": [p["positive"] / (p["total"] - p["positive"]) for p in points]},
+            index=[p["name"] for p in points]))
+        st.caption(f"Last {len(points)} {trend_by}s with WBCs detected, oldest first.")
+    else:
+        st.caption("No blood cell analyses recorded yet.")
 st.html(
     '''
     <style>
@@ -152,3 +238,8 @@ with col1:
 with col2:
     if st.button("Next Page", width="stretch"):
         st.switch_page("./pages/malarial_detection_page.py")
+
+# Poll the background job until every image is in
+if job is not None and not job.finished:
+    time.sleep(0.5)
+    st.rerun()
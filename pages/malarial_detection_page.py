@@ -1,6 +1,15 @@
 import streamlit as st
-from models.malarial_cells_model import run_detection, check_malaria_status
-import pandas as pd
+import functools
+import time
+from models.malarial_cells_model import run_detection_batch, check_malaria_status, infection_counts
+from models.jobs import job_manager, job_key, JobQueueFull
+from models.inference import describe_profile
+from models.tracing import span
+from models.config import MAX_IMAGES, EARLY_STOP, EARLY_STOP_TOLERANCE
+from models.history import history_store
+from models.sampling import RunningProportion, describe_interval, stop_when_settled
+from models.previews import overlays, thumbnails
+from models.dedup import deduplicate, describe_duplicates, duplicate_weights
 
 
 st.title("Malarial Detection")
@@ -55,24 +64,63 @@ with st.expander("What to Expect", expanded=False):
 
 uploaded_files = st.file_uploader(
     "Choose a file", type=["jpg", "png", "jpeg"], accept_multiple_files=True)
+profile = st.session_state.get("inference_profile")
+
+if len(uploaded_files) > MAX_IMAGES:
+    st.error(
+        f"At most {MAX_IMAGES} images can be analyzed at once; only the first {MAX_IMAGES} will be used.")
+    uploaded_files = uploaded_files[:MAX_IMAGES]
+
+dedup = deduplicate(uploaded_files, near=st.session_state.get("dedup_near", False))
+count_duplicates = st.session_state.get("count_duplicates", False)
+weights = duplicate_weights(dedup, count_duplicates)
+sample = (st.session_state.get("sample_id") or "").strip() or None
+tolerance = EARLY_STOP_TOLERANCE["malarial_cells"] if st.session_state.get(
+    "early_stop", EARLY_STOP) else None
 
 infected_count = 0
 uninfected_count = 0
 conf_rate = []
 files = []
-results = []
+records = []
+running = RunningProportion()
+job = None
 
 if len(uploaded_files) > 0:
-    st.image(uploaded_files, width=300, caption=[
-             file.name for file in uploaded_files])
+    with span("render.uploads", images=len(uploaded_files)):
+        previews = thumbnails(uploaded_files)
+        if previews:
+            st.image([image for image, _ in previews], width=300,
+                     caption=[name for _, name in previews])
     st.success(f"{len(uploaded_files)} file(s) uploaded successfully!")
-    for file in uploaded_files:
-        data, result = run_detection(file)
-        infected_count += len(data["Infected"])
-        uninfected_count += len(data["Uninfected"])
-        conf_rate.append(data["Confidence_rate"])
-        files.extend(data["File Name"])
-        results.extend(result)
+    if describe_duplicates(dedup, count_duplicates):
+        st.info(describe_duplicates(dedup, count_duplicates))
+    try:
+        job = job_manager.submit(job_key("malarial_cells", dedup["unique"], st.session_state.get("session_id"), profile=profile, early_stop=tolerance,
+                                         sample=sample),
+                                 functools.partial(run_detection_batch, profile=profile, sample=sample), dedup["unique"],
+                                 name="malarial_cells",
+                                 stop_when=stop_when_settled(infection_counts, tolerance) if tolerance else None)
+    except JobQueueFull as e:
+        st.error(str(e))
+    else:
+        if job.status == "failed":
+            st.error(f"Detection failed: {job.error}")
+        elif not job.finished:
+            st.progress(job.progress, text=f"Analyzing images... {job.completed}/{job.total}")
+        outputs, errors = job.snapshot()
+        for data, record in outputs:
+            weight = weights.get(record.digest, 1)
+            infected_count += len(data["Infected"]) * weight
+            uninfected_count += len(data["Uninfected"]) * weight
+            running.add(*infection_counts((data, record)), weight)
+            conf_rate.extend(data["Confidence_rate"])
+            files.extend(data["File Name"])
+            records.append(record)
+        for _, message in errors:
+            st.warning(message)
+        if job.stopped_early:
+            st.info(f"Stopped after {job.completed} of {job.total} images: the infection rate had settled.")
 
 
 else:
@@ -80,20 +128,34 @@ else:
         "Please upload one or more microscopic blood smear images for malarial detection.")
 
 st.subheader("Detection Results", divider="blue")
+st.caption(f"Inference profile: {describe_profile('malarial_cells', profile)}")
 
 
 if len(uploaded_files) > 0:
 
-    st.bar_chart(pd.DataFrame([infected_count, uninfected_count], columns=[
-                 'Count'], index=['Infected', 'UnInfected']))
-    summary_df = pd.DataFrame({
-        "File Name": files,
-        "Confidence Rate": conf_rate
-    })
-    st.line_chart(data=summary_df, x="File Name", y="Confidence Rate")
-
+    import pandas as pd
+
+    with span("render.charts"):
+        st.bar_chart(pd.DataFrame([infected_count, uninfected_count], columns=[
+                     'Count'], index=['Infected', 'UnInfected']))
+        summary_df = pd.DataFrame({
+            "File Name": files,
+            "Confidence Rate": conf_rate
+        })
+        st.line_chart(data=summary_df, x="File Name", y="Confidence Rate")
+
+    if st.toggle("Show detected cells"):
+        with span("render.overlays", images=len(records)):
+            annotated = overlays(uploaded_files, records)
+            if annotated:
+                st.image([image for image, _ in annotated], width=300,
+                         caption=[name for _, name in annotated])
+
+    # Statuses are judged on the interval, so a rate near a threshold stays
+    # inconclusive until enough cells are in
+    low, high = running.interval
     health_status, infection_percent, disclaimer = check_malaria_status(
-        infected_count, uninfected_count)
+        infected_count, uninfected_count, interval=(low * 100, high * 100))
 
     col1, col2 = st.columns([0.25, 0.75])
     with col1:
@@ -101,6 +163,7 @@ if len(uploaded_files) > 0:
             f"**Infected Cells:** $\\frac{{{infected_count}}}{{{infected_count + uninfected_count}}} =$ "
             f"{infection_percent:.2f}%"
         )
+        st.caption(describe_interval(running, tolerance))
     with col2:
         st.markdown("""
         <style>
@@ -113,7 +176,9 @@ if len(uploaded_files) > 0:
                     text="Infection %",)
 
     # Status with colored text
-    if "Healthy" in health_status:
+    if health_status.startswith("Inconclusive"):
+        st.warning(f"**Status:** {health_status}")
+    elif "Healthy" in health_status:
         st.success(f"**Status:** {health_status}")
     elif "Mild" in health_status:
         st.info(f"**Status:** {health_status}")
@@ -126,6 +191,19 @@ if len(uploaded_files) > 0:
     st.markdown(f"{disclaimer}")
 else:
     st.warning("Please upload valid images with detectable blood cells.")
+
+with st.expander("History", expanded=False):
+    trend_by = st.radio("Trend by", ["image", "sample"], horizontal=True, key="malaria_trend_by")
+    points = [point for point in history_store.trend("malarial_cells", classes=(0, 1), by=trend_by)
+              if point["total"]]
+    if points:
+        import pandas as pd
+
+        st.line_chart(pd.DataFrame({"Infected %": [p["share"] * 100 for p in points]},
+                                   index=[p["name"] for p in points]))
+        st.caption(f"Last {len(points)} {trend_by}s, oldest first.")
+    else:
+        st.caption("No malaria analyses recorded yet.")
 st.html(
     '''
     <style>
@@ -144,3 +222,8 @@ with col1:
 with col2:
     if st.button("Next Page", width="stretch"):
         st.switch_page("./pages/breast_cancer_detection_page.py")
+
+# Poll the background job until every image is in
+if job is not None and not job.finished:
+    time.sleep(0.5)
+    st.rerun()
@@ -0,0 +1,71 @@
+import streamlit as st
+from models.smear_pipeline import analyze_smear
+from models.inference import describe_profile
+from models.config import MAX_IMAGES
+from models.dedup import deduplicate, describe_duplicates, duplicate_weights
+
+
+st.title("Smear Analysis")
+
+st.subheader("Blood Cell Count and Malaria Screening in One Pass")
+
+st.markdown("""
+<p style='font-size:1.125rem'>Upload blood smear images once to run both the RBC/WBC detector and the malaria detector on them.
+Each image is decoded and resized a single time and both models run side by side, so the combined report costs little more than either analysis alone.</p>
+""", unsafe_allow_html=True)
+
+uploaded_files = st.file_uploader(
+    "Choose a file", type=["jpg", "png", "jpeg"], accept_multiple_files=True)
+profile = st.session_state.get("inference_profile")
+
+if len(uploaded_files) > MAX_IMAGES:
+    st.error(
+        f"At most {MAX_IMAGES} images can be analyzed at once; only the first {MAX_IMAGES} will be used.")
+    uploaded_files = uploaded_files[:MAX_IMAGES]
+
+dedup = deduplicate(uploaded_files, near=st.session_state.get("dedup_near", False))
+count_duplicates = st.session_state.get("count_duplicates", False)
+weights = duplicate_weights(dedup, count_duplicates)
+
+report = None
+if len(uploaded_files) > 0:
+    st.success(f"{len(uploaded_files)} file(s) uploaded successfully!")
+    if describe_duplicates(dedup, count_duplicates):
+        st.info(describe_duplicates(dedup, count_duplicates))
+    errors = []
+    report = analyze_smear(dedup["unique"], profile=profile, errors=errors, weights=weights,
+                           sample=(st.session_state.get("sample_id") or "").strip() or None)
+    for _, message in errors:
+        st.warning(message)
+else:
+    st.info("Please upload one or more microscopic blood smear images.")
+
+st.subheader("Smear Report", divider="blue")
+st.caption(
+    f"Inference profiles: {describe_profile('blood_cells', profile)}; {describe_profile('malarial_cells', profile)}")
+
+if report is not None and report["images"]:
+    import pandas as pd
+
+    totals = report["totals"]
+    col1, col2 = st.columns(2)
+    with col1:
+        st.bar_chart(pd.DataFrame([totals["RBC"], totals["WBC"]], columns=[
+                     'Count'], index=['RBC', 'WBC']))
+        st.markdown(r"$\frac{RBCs}{WBCs} = " + f"{report['ratio']:.2f}$")
+        st.info(report["ratio_status"])
+    with col2:
+        st.bar_chart(pd.DataFrame([totals["Infected"], totals["Uninfected"]], columns=[
+                     'Count'], index=['Infected', 'UnInfected']))
+        st.markdown(f"**Infected Cells:** {report['infection_percent']:.2f}%")
+        st.info(f"**Status:** {report['malaria_status']}")
+
+    st.dataframe(pd.DataFrame(report["images"]), hide_index=True)
+else:
+    st.warning("Please upload valid images with detectable blood cells.")
+
+st.markdown("""
+> ⚠️ **Disclaimer:**  
+> This system is for **educational and research purposes only**.  
+> It is **not a substitute for professional medical advice** or clinical diagnosis.
+""")
@@ -0,0 +1,198 @@
+# Score folders of images headlessly, without Streamlit.
+#
+#   python -m scripts.batch_score images/smears/ "archive/**/*.png" \
+#       --models blood_cells malarial_cells --output runs/overnight.parquet --resume
+#
+# Run from the project root. Per-image rows go to --output (.csv, .parquet or
+# .jsonl) and per-model totals to <output>_summary.<ext>. Rows are journaled
+# to <output>.journal.jsonl as each batch finishes, so an interrupted run
+# can be picked up again with --resume.
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from models.blood_cells_model import check_ratio
+from models.cache import content_hash, result_cache
+from models.config import BATCH_SIZE, MODEL_TASKS, PROFILE_NAMES
+from models.inference import cache_key, predict_images, resolve_profile
+from models.ingest import IMAGE_EXTENSIONS, decode_bytes
+from models.malarial_cells_model import check_malaria_status
+
+OUTPUT_FORMATS = (".csv", ".parquet", ".jsonl")
+
+
+def find_images(patterns, recursive=True):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**" if recursive else "", "*")
+        matches = glob.glob(pattern, recursive=recursive) if glob.has_magic(pattern) else [pattern]
+        paths.extend(path for path in matches
+                     if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(set(paths))
+
+
+def _load(path):
+    # Runs in a worker process: read, hash and decode one image
+    try:
+        with open(path, "rb") as f:
+            buffer = memoryview(f.read())
+        return path, content_hash(buffer), decode_bytes(buffer, path), None
+    except (OSError, ValueError) as e:
+        return path, None, None, str(e)
+
+
+def _prefetch(pool, paths, batch_size, depth=2):
+    # Keep `depth` batches decoding in the workers while the current one is
+    # being scored, without queueing the whole run up front.
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    futures = []
+    for batch in batches:
+        futures.append([pool.submit(_load, path) for path in batch])
+        if len(futures) > depth:
+            yield [future.result() for future in futures.pop(0)]
+    for batch_futures in futures:
+        yield [future.result() for future in batch_futures]
+
+
+def _row(path, model_id, record, seconds):
+    row = {"path": path, "model": model_id, "profile": record.profile,
+           "detections": len(record),
+           "mean_conf": round(float(record.conf.mean()), 4) if len(record) else None,
+           "seconds": round(seconds, 4)}
+    counts = record.counts(minlength=len(record.names))
+    for cls_id, name in sorted(record.names.items()):
+        row[f"count_{name}"] = int(counts[cls_id]) if cls_id < counts.size else 0
+    return row
+
+
+def summarize_rows(rows):
+    import pandas as pd
+
+    df = pd.DataFrame(rows)
+    summary = []
+    for model_id, group in df.groupby("model"):
+        ok = group[group["error"].isna()] if "error" in group else group
+        count_columns = [c for c in ok.columns if c.startswith("count_") and ok[c].notna().any()]
+        entry = {"model": model_id, "images": len(ok),
+                 "errors": len(group) - len(ok),
+                 "detections": int(ok["detections"].sum()) if "detections" in ok else 0}
+        entry.update({c: int(ok[c].sum()) for c in count_columns})
+        if model_id == "blood_cells":
+            rbc, wbc = entry.get("count_RBC", 0), entry.get("count_WBC", 0)
+            entry["rbc_wbc_ratio"] = rbc / wbc if wbc else float("inf")
+            entry["status"] = check_ratio(entry["rbc_wbc_ratio"])
+        elif model_id == "malarial_cells":
+            status = check_malaria_status(entry.get("count_Parasitized", 0),
+                                          entry.get("count_Uninfected", 0))
+            entry["infection_percent"] = status[1]
+            entry["status"] = status[0]
+        summary.append(entry)
+    return summary
+
+
+def _read_journal(path):
+    rows = []
+    if os.path.exists(path):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return rows
+
+
+def _write_table(rows, path):
+    import pandas as pd
+
+    if path.endswith(".jsonl"):
+        with open(path, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+    elif path.endswith(".parquet"):
+        pd.DataFrame(rows).to_parquet(path, index=False)
+    else:
+        pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score image folders with the BioScan detectors.")
+    parser.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("--models", nargs="+", choices=sorted(MODEL_TASKS),
+                        default=["blood_cells", "malarial_cells"])
+    parser.add_argument("--output", required=True,
+                        help="per-image results, .csv, .parquet or .jsonl")
+    parser.add_argument("--profile", choices=PROFILE_NAMES)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="decode processes")
+    parser.add_argument("--no-recursive", action="store_true")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip images already scored in the journal")
+    args = parser.parse_args()
+
+    stem, ext = os.path.splitext(args.output)
+    if ext not in OUTPUT_FORMATS:
+        parser.error(f"--output must end in one of {', '.join(OUTPUT_FORMATS)}")
+    journal_path = f"{args.output}.journal.jsonl"
+
+    paths = find_images(args.inputs, recursive=not args.no_recursive)
+    rows = _read_journal(journal_path) if args.resume else []
+    if not args.resume and os.path.exists(journal_path):
+        os.remove(journal_path)
+    done = {(row["path"], row["model"]) for row in rows}
+    todo = [path for path in paths
+            if any((path, model_id) not in done for model_id in args.models)]
+    print(f"{len(paths)} images found, {len(paths) - len(todo)} already scored", file=sys.stderr)
+
+    settings = {model_id: resolve_profile(model_id, args.profile)[1] for model_id in args.models}
+    start = time.perf_counter()
+    scored = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, open(journal_path, "a") as journal:
+        for batch in _prefetch(pool, todo, args.batch_size):
+            new_rows = []
+            for path, _, _, error in batch:
+                if error is not None:
+                    new_rows.extend({"path": path, "model": model_id, "error": error}
+                                    for model_id in args.models if (path, model_id) not in done)
+            loaded = [(path, digest, image) for path, digest, image, error in batch if error is None]
+
+            for model_id in args.models:
+                pending = [(path, digest, image) for path, digest, image in loaded
+                           if (path, model_id) not in done]
+                if not pending:
+                    continue
+                batch_start = time.perf_counter()
+                keys = [cache_key(model_id, digest, settings[model_id]) for _, digest, _ in pending]
+                records = [result_cache.get(key) for key in keys]
+                missing = [i for i, record in enumerate(records) if record is None]
+                predicted = predict_images(model_id, [(pending[i][0], pending[i][2]) for i in missing],
+                                           args.profile, args.batch_size)
+                for i, record in zip(missing, predicted):
+                    records[i] = record
+                    result_cache.put(keys[i], record)
+                per_image = (time.perf_counter() - batch_start) / len(pending)
+                new_rows.extend(_row(path, model_id, record, per_image)
+                                for (path, _, _), record in zip(pending, records))
+
+            for row in new_rows:
+                journal.write(json.dumps(row) + "\n")
+            journal.flush()
+            rows.extend(new_rows)
+            scored += len(batch)
+            rate = scored / (time.perf_counter() - start)
+            print(f"{scored}/{len(todo)} images, {rate:.1f} images/s", file=sys.stderr)
+
+    _write_table(rows, args.output)
+    _write_table(summarize_rows(rows) if rows else [], f"{stem}_summary{ext}")
+    os.remove(journal_path)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} images in {elapsed:.1f}s "
+          f"({scored / elapsed if elapsed else 0:.1f} images/s); results in {args.output}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# Inference benchmark for the BioScan models.
+#
+#   python -m scripts.benchmark --models blood_cells malarial_cells \
+#       --batch-sizes 1 8 --imgsz 320 640 --backends pytorch onnx --output bench.json
+#   python -m scripts.benchmark --models breast_cancer_ann --ann-backends numpy keras onnx
+#   python -m scripts.benchmark --save-baseline      # record scripts/benchmark_baseline.json
+#
+# Run from the project root. Every configuration runs in a fresh subprocess,
+# so cold start (imports + model load + first prediction) and peak RSS are
+# measured per configuration. Detectors go through run_detection_batch on the
+# images in assets/ plus upscaled copies, with the result cache and history store disabled;
+# breast_cancer_ann scores rows of the breast cancer dataset. With --cascade,
+# models that have a cascade in models/config.py run through it, and the
+# fraction of images escalated plus the speedup over running the large model
+# on every image are reported too. Results are written as JSON and compared
+# against the stored baseline.
+import time
+
+_PROCESS_START = time.perf_counter()
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+ASSETS = {
+    "blood_cells": ["assets/cells.jpg", "assets/cells2.jpg", "assets/multiple_cells.png"],
+    "malarial_cells": ["assets/infected*.png", "assets/not_infected*.png"],
+    "breast_cancer": ["assets/breast_cancer.jpg"],
+}
+ANN_MODEL = "breast_cancer_ann"
+
+
+def _peak_rss_mb():
+    import resource
+
+    # ru_maxrss is in KiB on Linux but in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _images(model_id, upscale):
+    import cv2
+    from models.config import MAX_IMAGE_PIXELS
+
+    paths = sorted({path for pattern in ASSETS[model_id] for path in glob.glob(pattern)})
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        for factor in upscale:
+            h, w = image.shape[:2]
+            if h * w * factor ** 2 > MAX_IMAGE_PIXELS:
+                continue
+            scaled = image if factor == 1 else cv2.resize(
+                image, (w * factor, h * factor), interpolation=cv2.INTER_CUBIC)
+            images.append(cv2.imencode(".png", scaled)[1].tobytes())
+    return images
+
+
+def _percentiles(latencies):
+    import numpy as np
+
+    latencies = np.asarray(latencies) * 1000
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2),
+            "mean_ms": round(float(latencies.mean()), 2)}
+
+
+def run_config(config):
+    # Runs inside the benchmark subprocess; the backend was set through the
+    # environment before models.config was imported.
+    from models.cache import result_cache
+    from models.config import BREAST_CANCER_DATASET, PROFILES
+    from models.registry import get_model
+
+    result_cache.max_entries = 0
+    model_id = config["model"]
+    import_seconds = time.perf_counter() - _PROCESS_START
+
+    if model_id == ANN_MODEL:
+        from models.breast_cancer_model import read_feature_table, validate_features
+
+        X = validate_features(read_feature_table(BREAST_CANCER_DATASET))
+        batch_size = config["batch_size"]
+        batches = [X[i:i + batch_size] for i in range(0, len(X) - batch_size + 1, batch_size)] \
+            or [X]
+        load_start = time.perf_counter()
+        classifier = get_model(ANN_MODEL)
+        load_seconds = time.perf_counter() - load_start
+        run = classifier.predict_proba
+    else:
+        from models.inference import run_batch
+
+        # Sweep imgsz through a copy of the default profile, leaving the
+        # configured profiles as they are
+        PROFILES[model_id] = dict(PROFILES[model_id], benchmark=dict(
+            PROFILES[model_id]["default"], imgsz=config["imgsz"]))
+        images = _images(model_id, config["upscale"])
+        batch_size = config["batch_size"]
+        batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+        load_start = time.perf_counter()
+        get_model(model_id)
+        load_seconds = time.perf_counter() - load_start
+        run = lambda batch: run_batch(model_id, batch, lambda record: record,
+                                      batch_size, profile="benchmark")
+
+    first_start = time.perf_counter()
+    run(batches[0])
+    first_seconds = time.perf_counter() - first_start
+    cold_start = time.perf_counter() - _PROCESS_START
+
+    latencies = []
+    items = 0
+    for batch in itertools.islice(itertools.cycle(batches), config["repeats"] * len(batches)):
+        start = time.perf_counter()
+        run(batch)
+        latencies.append(time.perf_counter() - start)
+        items += len(batch)
+
+    result = dict(config)
+    result.update(_percentiles(latencies))
+    result.update({
+        "items_per_second": round(items / sum(latencies), 2),
+        "calls": len(latencies),
+        "items": items,
+        "import_seconds": round(import_seconds, 3),
+        "load_seconds": round(load_seconds, 3),
+        "first_call_seconds": round(first_seconds, 3),
+        "cold_start_seconds": round(cold_start, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    })
+    if model_id == ANN_MODEL:
+        from models.backends import backend_label
+
+        # "keras" when the NumPy weights have not been exported yet
+        result["loaded_backend"] = backend_label(model_id)
+    if config.get("cascade"):
+        result.update(_cascade_speedup(model_id, images, batch_size, config["repeats"]))
+    return result
+
+
+def _cascade_speedup(model_id, images, batch_size, repeats):
+    # Both runs start from decoded images with every stage model loaded, so
+    # the ratio compares model time only
+    from models.cascade import cascade_stats
+    from models.config import CASCADES
+    from models.inference import predict_images
+    from models.ingest import decode_bytes
+
+    large = CASCADES[model_id]["large"]
+    named = [(f"image{i}", decode_bytes(memoryview(image))) for i, image in enumerate(images)]
+    runs = {"cascade": lambda: predict_images(model_id, named, "benchmark", batch_size),
+            "large_only": lambda: predict_images(model_id, named, "benchmark", batch_size,
+                                                 model_name=large)}
+    seconds = {}
+    before = cascade_stats().get(model_id, {"images": 0, "escalated": 0})
+    for name, run in runs.items():
+        run()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            run()
+        seconds[name] = (time.perf_counter() - start) / repeats
+    after = cascade_stats()[model_id]
+    # Count the timed passes and the warm-up pass alike
+    images_seen = after["images"] - before["images"]
+    return {
+        "cascade_large_model": large,
+        "escalated_fraction": round((after["escalated"] - before["escalated"]) / images_seen, 3)
+        if images_seen else 0.0,
+        "cascade_seconds_per_pass": round(seconds["cascade"], 4),
+        "large_only_seconds_per_pass": round(seconds["large_only"], 4),
+        "cascade_speedup": round(seconds["large_only"] / seconds["cascade"], 2)
+        if seconds["cascade"] else None,
+    }
+
+
+def config_id(config):
+    return "/".join(f"{key}={config.get(key)}" for key in
+                    ("model", "backend", "int8", "batch_size", "imgsz", "cascade"))
+
+
+def _spawn(config):
+    env = dict(os.environ)
+    env[f"BIOSCAN_BACKEND_{config['model'].upper()}"] = config["backend"]
+    env["BIOSCAN_INT8"] = "1" if config["int8"] else "0"
+    env.pop("BIOSCAN_CACHE_DIR", None)
+    env["BIOSCAN_HISTORY_DB"] = ""
+    env["BIOSCAN_CASCADE"] = config["model"] if config.get("cascade") else ""
+    env.pop("BIOSCAN_WARMUP", None)
+    proc = subprocess.run([sys.executable, "-m", "scripts.benchmark", "--run-config",
+                           json.dumps(config)], capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return dict(config, error=lines[-1] if lines else f"exit code {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    # Regressions of any configuration present in both runs
+    previous = {config_id(entry): entry for entry in baseline.get("results", [])}
+    regressions = []
+    for entry in results:
+        before = previous.get(config_id(entry))
+        if before is None or "error" in entry or "error" in before:
+            continue
+        checks = (("p95_ms", 1), ("peak_rss_mb", 1), ("cold_start_seconds", 1),
+                  ("items_per_second", -1))
+        for metric, direction in checks:
+            old, new = before[metric], entry[metric]
+            if old and direction * (new - old) / old > tolerance:
+                regressions.append({"config": config_id(entry), "metric": metric,
+                                    "baseline": old, "current": new,
+                                    "change": round((new - old) / old, 3)})
+    return regressions
+
+
+def main():
+    from models.backends import ANN_BACKENDS, DETECTOR_BACKENDS
+    from models.config import (BACKENDS, BENCHMARK_BASELINE, BENCHMARK_TOLERANCE, CASCADES,
+                               MODEL_TASKS, TRAIN_IMGSZ)
+
+    models = sorted(MODEL_TASKS) + [ANN_MODEL]
+    parser = argparse.ArgumentParser(description="Benchmark BioScan inference.")
+    parser.add_argument("--models", nargs="+", choices=models, default=models)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--imgsz", nargs="+", type=int,
+                        help="input sizes to sweep, default each model's training size")
+    parser.add_argument("--backends", nargs="+", choices=DETECTOR_BACKENDS, default=["pytorch"],
+                        help="detector backends")
+    parser.add_argument("--ann-backends", nargs="+", choices=ANN_BACKENDS,
+                        default=[BACKENDS[ANN_MODEL]],
+                        help=f"{ANN_MODEL} backends, default the configured one")
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--cascade", action="store_true",
+                        help="run models that have a cascade through it")
+    parser.add_argument("--upscale", nargs="+", type=int, default=[1, 2],
+                        help="synthetic upscaling factors applied to each asset")
+    parser.add_argument("--repeats", type=int, default=5, help="passes over the image set")
+    parser.add_argument("--output", help="write results JSON here as well as to stdout")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE)
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_config:
+        print(json.dumps(run_config(json.loads(args.run_config))))
+        return
+
+    configs = []
+    for model_id in args.models:
+        ann = model_id == ANN_MODEL
+        sizes = [None] if ann else (args.imgsz or [TRAIN_IMGSZ[model_id]])
+        backends = args.ann_backends if ann else args.backends
+        for backend, batch_size, imgsz in itertools.product(backends, args.batch_sizes, sizes):
+            configs.append({"model": model_id, "backend": backend,
+                            "int8": args.int8, "batch_size": batch_size, "imgsz": imgsz,
+                            "upscale": None if ann else args.upscale,
+                            "cascade": args.cascade and model_id in CASCADES,
+                            "repeats": args.repeats})
+
+    results = []
+    for config in configs:
+        print(f"Running {config_id(config)}", file=sys.stderr)
+        results.append(_spawn(config))
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+              "cpu_count": os.cpu_count(), "results": results}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text)
+        print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# Export BioScan models for CPU inference backends and check accuracy drift.
+#
+#   python -m scripts.export_models blood_cells malarial_cells --backend openvino --int8 --check
+#   python -m scripts.export_models breast_cancer_ann --backend onnx
+#   python -m scripts.export_models breast_cancer_ann --backend numpy --check
+#
+# Run from the project root. Select the exported artifacts at serving time
+# with BIOSCAN_BACKEND / BIOSCAN_BACKEND_<MODEL> and BIOSCAN_INT8=1.
+import argparse
+import json
+
+from models.backends import check_drift, export
+from models.config import CALIBRATION_IMAGES, MODEL_PATHS, MODEL_VARIANTS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export BioScan models for ONNX Runtime or OpenVINO.")
+    parser.add_argument("models", nargs="+", choices=sorted([*MODEL_PATHS, *MODEL_VARIANTS]))
+    parser.add_argument("--backend", choices=["onnx", "openvino", "numpy"], required=True,
+                        help="numpy applies to breast_cancer_ann only")
+    parser.add_argument("--int8", action="store_true",
+                        help="quantize with a calibration set from the dataset YAML")
+    parser.add_argument("--data", help="override the dataset YAML used for calibration")
+    parser.add_argument("--check", action="store_true",
+                        help="report accuracy drift against the PyTorch/Keras baseline")
+    parser.add_argument("--limit", type=int, default=CALIBRATION_IMAGES,
+                        help="images (or CSV rows) used for the drift check")
+    args = parser.parse_args()
+
+    for name in args.models:
+        path = export(name, args.backend, args.int8, args.data)
+        print(f"{name}: exported {path}")
+        if args.check:
+            print(json.dumps(check_drift(name, args.backend, args.int8, args.limit), indent=2))
+
+
+if __name__ == "__main__":
+    main()
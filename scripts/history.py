@@ -0,0 +1,48 @@
+# Query the BioScan analysis history.
+#
+#   python -m scripts.history stats
+#   python -m scripts.history trend malarial_cells --limit 500 --by sample
+#   python -m scripts.history samples blood_cells --limit 20
+#
+# Run from the project root. Reads the SQLite store the app and
+# run_detection_batch write to (config.HISTORY_DB); prints JSON on stdout and
+# the query time on stderr.
+import argparse
+import json
+import sys
+import time
+
+from models.config import HISTORY_DB, HISTORY_TREND_LIMIT, MODEL_TASKS
+from models.history import HistoryStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the BioScan analysis history.")
+    parser.add_argument("query", choices=["stats", "trend", "samples"])
+    parser.add_argument("model", nargs="?", choices=sorted(MODEL_TASKS))
+    parser.add_argument("--db", default=HISTORY_DB, help="history database file")
+    parser.add_argument("--limit", type=int, default=HISTORY_TREND_LIMIT)
+    parser.add_argument("--by", choices=["image", "sample"], default="image",
+                        help="trend over single images or over samples")
+    parser.add_argument("--classes", type=int, nargs="+", default=[0, 1],
+                        help="class ids for the trend share; the first one is counted")
+    args = parser.parse_args()
+    if args.query != "stats" and args.model is None:
+        parser.error(f"{args.query} needs a model")
+    if not args.db:
+        parser.error("no history database configured; pass --db or set BIOSCAN_HISTORY_DB")
+
+    store = HistoryStore(args.db)
+    start = time.perf_counter()
+    if args.query == "stats":
+        result = store.stats()
+    elif args.query == "trend":
+        result = store.trend(args.model, tuple(args.classes), args.limit, args.by)
+    else:
+        result = store.samples(args.model, args.limit)
+    print(f"{args.query}: {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
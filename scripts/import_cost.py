@@ -0,0 +1,86 @@
+# Measure startup and per-page import cost.
+#
+#   python -m scripts.import_cost
+#   python -m scripts.import_cost --targets models.jobs pages/homepage.py --output imports.json
+#
+# Run from the project root. Each target is measured in a fresh interpreter:
+# modules are imported, pages are rendered once headlessly with Streamlit's
+# AppTest (time to first paint, before any upload). Reports seconds, RSS and
+# which heavy frameworks ended up imported.
+import argparse
+import glob
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("tensorflow", "torch", "ultralytics", "pandas", "cv2", "PIL",
+                 "sklearn", "onnxruntime", "openvino", "matplotlib")
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def probe(target):
+    # Runs in the child interpreter
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    if target.endswith(".py"):
+        from streamlit.testing.v1 import AppTest
+
+        app = AppTest.from_file(target, default_timeout=120).run()
+        failed = [str(e.value) for e in app.exception]
+    else:
+        importlib.import_module(target)
+        failed = []
+    return {"target": target,
+            "seconds": round(time.perf_counter() - start, 3),
+            "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+            "heavy_imports": [name for name in HEAVY_MODULES if name in sys.modules],
+            "errors": failed}
+
+
+def measure(target):
+    proc = subprocess.run([sys.executable, "-m", "scripts.import_cost", "--probe", target],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {"target": target, "errors": [lines[-1] if lines else f"exit code {proc.returncode}"]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    default_targets = ["models.jobs", "models.blood_cells_model", "models.breast_cancer_model",
+                       "main.py"] + sorted(glob.glob("pages/*.py"))
+    parser = argparse.ArgumentParser(description="Measure BioScan import and first-paint cost.")
+    parser.add_argument("--targets", nargs="+", default=default_targets,
+                        help="module names or page files")
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(args.probe)))
+        return
+
+    results = [measure(target) for target in args.targets]
+    for result in results:
+        if "seconds" in result:
+            heavy = ", ".join(result["heavy_imports"]) or "-"
+            print(f"{result['target']:45} {result['seconds']:7.3f}s "
+                  f"{result['rss_delta_mb']:7.1f} MB  {heavy}", file=sys.stderr)
+        else:
+            print(f"{result['target']:45} failed: {result['errors'][0]}", file=sys.stderr)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Load generator for scripts/serve.py.
+#
+#   python -m scripts.serve &
+#   python -m scripts.load_test assets/*.png --model blood_cells --concurrency 16 --requests 400
+#
+# Sends the given images round-robin from `concurrency` threads and reports
+# throughput, latency percentiles, status codes and the server's batcher
+# counters, so batch sizes and backpressure can be tuned on one machine.
+import argparse
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+
+def _post(url, body, content_type):
+    request = urllib.request.Request(url, data=body, method="POST",
+                                     headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+def run_load(url, bodies, content_type, concurrency, total):
+    # One (status, seconds) pair per request
+    counter = itertools.count()
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            n = next(counter)
+            if n >= total:
+                return
+            start = time.perf_counter()
+            status = _post(url, bodies[n % len(bodies)], content_type)
+            with lock:
+                results.append((status, time.perf_counter() - start))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = np.array([seconds for status, seconds in results if status == 200])
+    summary = {"requests": len(results), "seconds": round(elapsed, 3),
+               "ok_per_second": round(ok.size / elapsed, 2) if elapsed else 0.0,
+               "statuses": statuses}
+    if ok.size:
+        p50, p95, p99 = np.percentile(ok, [50, 95, 99]) * 1000
+        summary.update({"p50_ms": round(p50, 1), "p95_ms": round(p95, 1),
+                        "p99_ms": round(p99, 1), "max_ms": round(ok.max() * 1000, 1)})
+    return summary
+
+
+def _batcher_metrics(base_url, model):
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+            text = response.read().decode()
+    except OSError:
+        return {}
+    return {line.split("{")[0].removeprefix("bioscan_batcher_"): float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines()
+            if line.startswith("bioscan_batcher_") and f'model="{model}"' in line}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load against the BioScan HTTP service.")
+    parser.add_argument("inputs", nargs="*", help="images to send (unused for breast_cancer_ann)")
+    parser.add_argument("--url", default="http://127.0.0.1:8502")
+    parser.add_argument("--model", default="blood_cells")
+    parser.add_argument("--profile")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=1,
+                        help="feature rows per breast_cancer_ann request")
+    args = parser.parse_args()
+
+    url = f"{args.url}/v1/{args.model}"
+    if args.profile:
+        url += f"?profile={args.profile}"
+    if args.model == "breast_cancer_ann":
+        rng = np.random.default_rng(0)
+        bodies = [json.dumps({"rows": rng.random((args.rows, 30)).tolist()}).encode()
+                  for _ in range(16)]
+        content_type = "application/json"
+    else:
+        if not args.inputs:
+            parser.error("pass at least one image to send")
+        bodies = []
+        for path in args.inputs:
+            with open(path, "rb") as f:
+                bodies.append(f.read())
+        content_type = "application/octet-stream"
+
+    results, elapsed = run_load(url, bodies, content_type, args.concurrency, args.requests)
+    summary = summarize(results, elapsed)
+    summary["batcher"] = _batcher_metrics(args.url, args.model)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Prepare YOLO training datasets.
+#
+#   python -m scripts.prepare_dataset blood_cells
+#   python -m scripts.prepare_dataset all --check-only
+#   python -m scripts.prepare_dataset blood_cells --annotations scripts/annotations.csv --labels-dir scripts/labels_test
+#
+# Run from the project root. For models with box annotations (see
+# config.DATASET_ANNOTATIONS) writes one YOLO label file per image, normalized
+# by the image's real size. Then validates the dataset YAML and builds the
+# Ultralytics label cache for every split, so training starts without
+# rescanning the dataset. Re-running only rewrites labels whose boxes changed,
+# and empties the label files of images left without valid boxes.
+# Labels go where Ultralytics reads them, .../labels/<split>/ next to
+# .../images/<split>/, not to the notebook's labels_test/; pass --labels-dir
+# to write elsewhere.
+import argparse
+import json
+import sys
+
+from models.config import DATASET_ANNOTATIONS, DATASET_WORKERS, DATASET_YAMLS, MODEL_TASKS, TRAIN_IMGSZ
+from models.datasets import build_label_cache, prepare_labels, validate_dataset
+
+
+def prepare(model_id, args):
+    data_yaml = args.data or DATASET_YAMLS[model_id]
+    task = MODEL_TASKS[model_id]
+    report = {"model": model_id, "data": data_yaml}
+    annotations = args.annotations or DATASET_ANNOTATIONS.get(model_id)
+    if annotations and not args.check_only:
+        report["labels"] = prepare_labels(data_yaml, annotations, args.labels_dir, args.workers)
+    report["validation"] = validate_dataset(data_yaml, task, args.workers)
+    if not args.check_only and not args.no_cache and not report["validation"]["errors"]:
+        report["label_cache"] = build_label_cache(data_yaml, task, TRAIN_IMGSZ[model_id])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert annotations to YOLO labels, validate datasets and build label caches.")
+    parser.add_argument("models", nargs="+", choices=sorted([*DATASET_YAMLS, "all"]))
+    parser.add_argument("--data", help="override the dataset YAML (single model only)")
+    parser.add_argument("--annotations", help="override the annotations CSV (single model only)")
+    parser.add_argument("--labels-dir",
+                        help="write label files here instead of next to the images")
+    parser.add_argument("--check-only", action="store_true",
+                        help="only validate; write no labels or caches")
+    parser.add_argument("--no-cache", action="store_true", help="skip building the label cache")
+    parser.add_argument("--workers", type=int, default=DATASET_WORKERS,
+                        help="threads reading image headers and label files")
+    args = parser.parse_args()
+
+    models = sorted(DATASET_YAMLS) if "all" in args.models else args.models
+    if (args.data or args.annotations) and len(models) > 1:
+        parser.error("--data and --annotations apply to a single model")
+
+    reports = [prepare(model_id, args) for model_id in models]
+    failed = False
+    for report in reports:
+        labels = report.get("labels")
+        if labels:
+            print(f"{report['model']}: {labels['boxes']} boxes in {labels['images']} label files, "
+                  f"{labels['written']} written, {labels['unchanged']} unchanged, "
+                  f"{labels['emptied']} stale emptied", file=sys.stderr)
+            if labels["missing_images"]:
+                print(f"  {len(labels['missing_images'])} annotated images not found in "
+                      f"{report['data']}", file=sys.stderr)
+        for split, stats in report["validation"]["splits"].items():
+            print(f"  {split}: {stats['labelled']}/{stats['images']} images labelled, "
+                  f"{stats['boxes']} boxes", file=sys.stderr)
+        for error in report["validation"]["errors"]:
+            print(f"  error: {error}", file=sys.stderr)
+            failed = True
+    print(json.dumps(reports, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# Local HTTP inference service for the BioScan models.
+#
+#   python -m scripts.serve --port 8502
+#
+#   curl --data-binary @smear.png "http://127.0.0.1:8502/v1/blood_cells?profile=fast"
+#   curl -H "Content-Type: application/json" -d '{"rows": [[17.99, 10.38, ...]]}' \
+#       http://127.0.0.1:8502/v1/breast_cancer_ann
+#
+# Run from the project root. Each detector has a micro-batcher per inference
+# profile (the ANN a single one), so concurrent requests share one forward
+# pass. GET /healthz reports liveness, /readyz turns 200 once every served
+# model is loaded and /metrics exposes Prometheus-style counters. A full queue
+# answers 503 with Retry-After, a request with no result within REQUEST_TIMEOUT
+# 504. A failing batch is retried item by item, so only the bad request fails.
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from models.batcher import BatcherFull, MicroBatcher
+from models.cache import content_hash, result_cache
+from models.config import (MAX_IMAGE_BYTES, MODEL_TASKS, PROFILE_NAMES, SERVICE_HOST,
+                           SERVICE_MAX_BATCH, SERVICE_MAX_WAIT_MS, SERVICE_PORT,
+                           SERVICE_QUEUE_SIZE)
+from models.ingest import decode_bytes
+from models.registry import get_model, is_loaded, model_stats, warm_up
+from models.tracing import prometheus_lines
+
+ANN_MODEL = "breast_cancer_ann"
+REQUEST_TIMEOUT = 60
+
+
+class Service:
+    def __init__(self, models, max_batch=SERVICE_MAX_BATCH, max_wait_ms=SERVICE_MAX_WAIT_MS,
+                 queue_size=SERVICE_QUEUE_SIZE):
+        self.models = models
+        self.batch_options = {"max_batch": max_batch, "max_wait_ms": max_wait_ms,
+                              "queue_size": queue_size}
+        self.started = time.time()
+        self._batchers = {}
+        self._lock = threading.Lock()
+        self._latency = {}
+
+    def batcher(self, model_id, profile):
+        # Profiles only change the detectors, so the ANN has a single batcher
+        key = (model_id, None if model_id == ANN_MODEL else profile)
+        with self._lock:
+            if key not in self._batchers:
+                if model_id == ANN_MODEL:
+                    fn = self._classify
+                else:
+                    fn = lambda items, model_id=model_id, profile=profile: \
+                        self._detect(model_id, profile, items)
+                self._batchers[key] = MicroBatcher(
+                    fn, name=f"bioscan-batch-{model_id}", **self.batch_options)
+            return self._batchers[key]
+
+    @staticmethod
+    def _detect(model_id, profile, items):
+        # items are (name, digest, image); cached images skip the forward pass
+        from models.inference import cache_key, predict_images, resolve_profile
+
+        _, params = resolve_profile(model_id, profile)
+        keys = [cache_key(model_id, digest, params) for _, digest, _ in items]
+        records = [result_cache.get(key) for key in keys]
+        missing = [i for i, record in enumerate(records) if record is None]
+        predicted = predict_images(model_id, [(items[i][0], items[i][2]) for i in missing],
+                                   profile, len(items))
+        for i, record in zip(missing, predicted):
+            records[i] = record
+            result_cache.put(keys[i], record)
+        return [record.with_file_name(name).to_dict()
+                for (name, _, _), record in zip(items, records)]
+
+    @staticmethod
+    def _classify(items):
+        # items are (n, 30) feature arrays, scored in one ANN call
+        sizes = [len(rows) for rows in items]
+        proba = get_model(ANN_MODEL).predict_proba(np.concatenate(items))
+        outputs = []
+        for chunk in np.split(proba, np.cumsum(sizes)[:-1]):
+            outputs.append({"probability": np.round(chunk.astype(np.float64), 4).tolist(),
+                            "prediction": (chunk > 0.5).astype(int).tolist()})
+        return outputs
+
+    def observe(self, model_id, status, seconds):
+        with self._lock:
+            count, total = self._latency.get((model_id, status), (0, 0.0))
+            self._latency[model_id, status] = (count + 1, total + seconds)
+
+    def ready(self):
+        return all(is_loaded(name) for name in self.models)
+
+    def metrics(self):
+        lines = ["# TYPE bioscan_requests_total counter",
+                 "# TYPE bioscan_request_seconds_total counter"]
+        with self._lock:
+            latency = dict(self._latency)
+            batchers = dict(self._batchers)
+        for (model_id, status), (count, total) in sorted(latency.items()):
+            labels = f'model="{model_id}",status="{status}"'
+            lines.append(f"bioscan_requests_total{{{labels}}} {count}")
+            lines.append(f"bioscan_request_seconds_total{{{labels}}} {total:.6f}")
+        for (model_id, profile), batcher in sorted(batchers.items(), key=lambda kv: str(kv[0])):
+            labels = f'model="{model_id}",profile="{profile or "default"}"'
+            for name, value in batcher.stats().items():
+                lines.append(f"bioscan_batcher_{name}{{{labels}}} {value}")
+        for model_id, stats in sorted(model_stats().items()):
+            for name in ("load_seconds", "warmup_seconds", "rss_after_mb"):
+                if stats.get(name) is not None:
+                    lines.append(f'bioscan_model_{name}{{model="{model_id}"}} {stats[name]}')
+        cache = result_cache.stats()
+        for name in ("entries", "hits", "disk_hits", "misses"):
+            lines.append(f"bioscan_result_cache_{name} {cache[name]}")
+        lines.extend(prometheus_lines())
+        lines.append(f"bioscan_uptime_seconds {time.time() - self.started:.1f}")
+        return "\n".join(lines) + "\n"
+
+
+def _parse_rows(body):
+    from models.breast_cancer_model import FEATURE_COLUMNS
+
+    payload = json.loads(body)
+    rows = payload.get("rows") if isinstance(payload, dict) else payload
+    if not rows:
+        raise ValueError('Expected a JSON body like {"rows": [[...30 features...], ...]}')
+    if isinstance(rows[0], dict):
+        # Same column spelling rules as the batch prediction upload
+        rows = [{str(k).strip().lower().replace(" ", "_"): v for k, v in row.items()}
+                for row in rows]
+        missing = [c for c in FEATURE_COLUMNS if c not in rows[0]]
+        if missing:
+            raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+        rows = [[row[c] for c in FEATURE_COLUMNS] for row in rows]
+    X = np.asarray(rows, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != len(FEATURE_COLUMNS) or np.isnan(X).any():
+        raise ValueError(f"Each row needs {len(FEATURE_COLUMNS)} numeric features")
+    return X
+
+
+class Handler(BaseHTTPRequestHandler):
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self._send(200, {"status": "ok"})
+        elif path == "/readyz":
+            ready = self.service.ready()
+            loaded = {name: is_loaded(name) for name in self.service.models}
+            errors = {name: stats["error"] for name, stats in model_stats().items()
+                      if "error" in stats}
+            self._send(200 if ready else 503,
+                       {"ready": ready, "models": loaded, "errors": errors})
+        elif path == "/metrics":
+            self._send(200, self.service.metrics(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        model_id = url.path.rstrip("/").rsplit("/", 1)[-1]
+        if not url.path.startswith("/v1/") or model_id not in self.service.models:
+            self._send(404, {"error": f"Unknown model path {url.path}",
+                             "models": self.service.models})
+            return
+
+        start = time.perf_counter()
+        status, body, headers = self._predict(model_id, url)
+        self.service.observe(model_id, status, time.perf_counter() - start)
+        self._send(status, body, headers=headers)
+
+    def _predict(self, model_id, url):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_IMAGE_BYTES:
+            # Refuse without reading the body and drop the connection
+            self.close_connection = True
+            return 413, {"error": f"Body exceeds {MAX_IMAGE_BYTES} bytes"}, None
+        body = self.rfile.read(length)
+        query = parse_qs(url.query)
+        profile = query.get("profile", [None])[0]
+        if profile is not None and profile not in PROFILE_NAMES:
+            return 400, {"error": f"Unknown profile {profile!r}"}, None
+
+        try:
+            if model_id == ANN_MODEL:
+                item = _parse_rows(body)
+            else:
+                buffer = memoryview(body)
+                name = query.get("name", ["image"])[0]
+                item = (name, content_hash(buffer), decode_bytes(buffer, name))
+        except (ValueError, TypeError) as e:
+            return 400, {"error": str(e)}, None
+
+        try:
+            future = self.service.batcher(model_id, profile).submit(item)
+        except BatcherFull as e:
+            return 503, {"error": f"Server busy: {e}"}, {"Retry-After": "1"}
+        try:
+            return 200, future.result(timeout=REQUEST_TIMEOUT), None
+        except FutureTimeout:
+            return 504, {"error": f"No result within {REQUEST_TIMEOUT} s"}, None
+        except Exception as e:
+            return 500, {"error": str(e)}, None
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    # The listen backlog defaults to 5, so a burst of connections would be
+    # reset before the batchers ever saw it and answered 503
+    daemon_threads = True
+
+    def __init__(self, address, handler, backlog=SERVICE_QUEUE_SIZE):
+        self.request_queue_size = max(backlog, SERVICE_QUEUE_SIZE)
+        super().__init__(address, handler)
+
+
+def main():
+    served = sorted(MODEL_TASKS) + [ANN_MODEL]
+    parser = argparse.ArgumentParser(description="Serve the BioScan models over local HTTP.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--models", nargs="+", choices=served, default=served)
+    parser.add_argument("--max-batch", type=int, default=SERVICE_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=SERVICE_MAX_WAIT_MS)
+    parser.add_argument("--queue-size", type=int, default=SERVICE_QUEUE_SIZE)
+    parser.add_argument("--lazy", action="store_true",
+                        help="load models on their first request instead of at startup")
+    args = parser.parse_args()
+
+    Handler.service = Service(args.models, args.max_batch, args.max_wait_ms, args.queue_size)
+    if not args.lazy:
+        warm_up(args.models)
+    server = Server((args.host, args.port), Handler, args.queue_size * len(args.models))
+    print(f"Serving {', '.join(args.models)} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
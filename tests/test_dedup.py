@@ -0,0 +1,57 @@
+import io
+
+import pytest
+
+from models import dedup
+from models.inference import upload_hash
+
+
+def upload(name, data):
+    uploaded_file = io.BytesIO(data)
+    uploaded_file.name = name
+    return uploaded_file
+
+
+@pytest.fixture
+def dhashes(monkeypatch):
+    # dHash by file content, so near duplicates don't need cv2 or real images
+    hashes = {}
+    monkeypatch.setattr(dedup, "_upload_dhash",
+                        lambda uploaded_file, digest: hashes[uploaded_file.getvalue()])
+    return hashes
+
+
+def test_exact_copy_of_near_duplicate(dhashes):
+    dhashes.update({b"slide": 0b1111, b"slide small": 0b1110})
+    files = [upload("slide.jpg", b"slide"), upload("slide_small.jpg", b"slide small"),
+             upload("slide_small.jpg", b"slide small")]
+
+    report = dedup.deduplicate(files, near=True)
+
+    assert report["unique"] == files[:1]
+    assert report["copies"] == {upload_hash(files[0]): 3}
+    assert report["duplicates"] == [("slide_small.jpg", "slide.jpg", "near"),
+                                    ("slide_small.jpg", "slide_small.jpg", "exact")]
+
+
+def test_same_name_different_images():
+    files = [upload("image.jpg", b"first"), upload("image.jpg", b"second"),
+             upload("image.jpg", b"second")]
+
+    report = dedup.deduplicate(files)
+
+    assert report["unique"] == files[:2]
+    assert report["copies"] == {upload_hash(files[0]): 1, upload_hash(files[1]): 2}
+    assert sum(report["copies"].values()) == len(files)
+    assert dedup.duplicate_weights(report, include=True) == report["copies"]
+    assert dedup.duplicate_weights(report, include=False) == {}
+
+
+def test_near_duplicates_off_by_default(dhashes):
+    dhashes.update({b"a": 0b1111, b"b": 0b1110})
+    files = [upload("a.jpg", b"a"), upload("b.jpg", b"b")]
+
+    report = dedup.deduplicate(files)
+
+    assert report["unique"] == files
+    assert report["duplicates"] == []
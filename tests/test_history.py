@@ -0,0 +1,65 @@
+import numpy as np
+
+from models.history import HistoryStore
+from models.masks import MaskSet
+from models.records import Detections
+
+
+def record(name, cls, masks=False):
+    n = len(cls)
+    boxes = np.array([[i * 10, 0, i * 10 + 8, 8] for i in range(n)], dtype=np.float32)
+    mask_set = None
+    if masks:
+        dense = np.zeros((n, 8, n * 10), dtype=bool)
+        for i in range(n):
+            dense[i, 1:7, i * 10 + 1:i * 10 + 7] = True
+        mask_set = MaskSet.from_dense(dense, (1.0, 1.0), boxes)
+    return Detections(name, cls, np.linspace(0.5, 0.9, n), boxes, (8, n * 10),
+                      {0: "infected", 1: "uninfected"},
+                      None if mask_set is None else mask_set.areas(), "default", mask_set)
+
+
+def test_round_trip(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    original = record("a.png", [0, 1, 1], masks=True)
+    store.record("malarial_cells", "v1", "default", [("digest-a", original)])
+
+    loaded = store.get("digest-a", "malarial_cells", "v1", "default")
+    assert loaded.file_name == "a.png"
+    np.testing.assert_array_equal(loaded.cls, original.cls)
+    np.testing.assert_array_equal(loaded.conf, original.conf)
+    np.testing.assert_array_equal(loaded.boxes, original.boxes)
+    np.testing.assert_array_equal(loaded.mask_area, original.mask_area)
+    np.testing.assert_array_equal(loaded.masks.decode(), original.masks.decode())
+    assert loaded.names == original.names
+    assert loaded.image_shape == original.image_shape
+    # Other versions and profiles are separate entries
+    assert store.get("digest-a", "malarial_cells", "v2", "default") is None
+    assert store.get("digest-a", "malarial_cells", "v1", "fast") is None
+
+
+def test_sample_totals_count_each_image_once(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    a, b = record("a.png", [0, 1, 1]), record("b.png", [0, 0])
+    store.record("malarial_cells", "v1", "default", [("a", a), ("a", a), ("b", b)], sample="p1")
+    # Analyzing the same image again, even under another name, adds nothing
+    store.record("malarial_cells", "v1", "default", [("a", a.with_file_name("copy.png"))],
+                 sample="p1")
+
+    (sample,) = store.samples("malarial_cells")
+    assert sample["sample"] == "p1"
+    assert sample["images"] == 2
+    assert sample["detections"] == 5
+    assert sample["counts"] == {0: 3, 1: 2}
+    assert store.writes == 2
+
+    points = store.trend("malarial_cells", by="sample")
+    assert [point["share"] for point in points] == [0.6]
+
+
+def test_disabled_store_is_a_no_op():
+    store = HistoryStore(None)
+    store.record("malarial_cells", "v1", "default", [("a", record("a.png", [0]))], sample="p1")
+    assert store.get("a", "malarial_cells", "v1", "default") is None
+    assert store.samples("malarial_cells") == []
+    assert store.stats()["analyses"] == 0
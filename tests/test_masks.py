@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from models.masks import MaskSet
+
+
+def random_masks(seed, n=6, shape=(40, 50)):
+    # Blobs cropped to their boxes, like Ultralytics masks, placed so that
+    # some boxes overlap
+    rng = np.random.default_rng(seed)
+    dense = np.zeros((n, *shape), dtype=bool)
+    boxes = np.zeros((n, 4), dtype=np.float32)
+    for i in range(n):
+        x1, y1 = rng.integers(0, shape[1] - 12), rng.integers(0, shape[0] - 12)
+        x2, y2 = x1 + rng.integers(4, 12), y1 + rng.integers(4, 12)
+        dense[i, y1:y2, x1:x2] = rng.random((y2 - y1, x2 - x1)) < 0.7
+        boxes[i] = (x1, y1, x2, y2)
+    return dense, boxes
+
+
+def brute_force(dense):
+    n = len(dense)
+    pixels = dense.reshape(n, -1).sum(axis=1)
+    mean, cov = [], []
+    for mask in dense:
+        ys, xs = np.nonzero(mask)
+        x, y = xs + 0.5, ys + 0.5
+        mean.append((x.mean(), y.mean()))
+        cov.append((x.var(), y.var(), ((x - x.mean()) * (y - y.mean())).mean()))
+    max_iou = np.zeros(n)
+    for i in range(n):
+        for j in range(n):
+            if i != j:
+                inter = (dense[i] & dense[j]).sum()
+                max_iou[i] = max(max_iou[i], inter / (dense[i] | dense[j]).sum())
+    covered = dense.sum(axis=0) > 1
+    overlap = (dense & covered).reshape(n, -1).sum(axis=1) / pixels
+    return pixels, np.array(mean), np.array(cov), max_iou, overlap, dense.any(axis=0).sum()
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_statistics_match_brute_force(seed):
+    dense, boxes = random_masks(seed)
+    masks = MaskSet.from_dense(dense, (1.0, 1.0), boxes)
+    pixels, mean, cov, max_iou, overlap, union = brute_force(dense)
+
+    np.testing.assert_array_equal(masks.pixels, pixels)
+    np.testing.assert_allclose(masks.mean, mean, atol=1e-4)
+    np.testing.assert_allclose(masks.cov, cov, atol=1e-3)
+    np.testing.assert_allclose(masks.max_iou, max_iou, atol=1e-6)
+    np.testing.assert_allclose(masks.overlap, overlap, atol=1e-6)
+    assert masks.union_pixels == union
+
+
+def test_decode_and_label_map_round_trip():
+    dense, boxes = random_masks(3)
+    masks = MaskSet.from_dense(dense, (1.0, 1.0), boxes)
+
+    np.testing.assert_array_equal(masks.decode(), dense)
+    np.testing.assert_array_equal(masks.decode([4, 1]), dense[[4, 1]])
+    labels = masks.label_map()
+    for i in range(len(dense)):
+        # Later instances are drawn on top
+        visible = dense[i] & ~dense[i + 1:].any(axis=0)
+        assert (labels[visible] == i + 1).all()
+    assert (labels[~dense.any(axis=0)] == 0).all()
+
+
+def test_scale_and_serialization():
+    dense, boxes = random_masks(4)
+    masks = MaskSet.from_dense(dense, (2.0, 3.0), boxes)
+    np.testing.assert_allclose(masks.areas(), dense.reshape(len(dense), -1).sum(axis=1) * 6)
+    assert masks.union_area() == dense.any(axis=0).sum() * 6
+
+    loaded = MaskSet.from_bytes(masks.to_bytes())
+    assert loaded.shape == masks.shape and loaded.scale == masks.scale
+    np.testing.assert_array_equal(loaded.decode(), dense)
+    np.testing.assert_array_equal(loaded.max_iou, masks.max_iou)
+
+
+def test_empty():
+    masks = MaskSet.from_dense(np.zeros((0, 8, 8), dtype=bool), (1.0, 1.0),
+                               np.zeros((0, 4), dtype=np.float32))
+    assert len(masks) == 0
+    assert masks.decode().shape == (0, 8, 8)
+    assert masks.union_area() == 0.0
+    assert masks.metrics()["area"].shape == (0,)
@@ -0,0 +1,51 @@
+import math
+
+import pytest
+
+from models.jobs import JobManager
+from models.sampling import RunningProportion, stop_when_settled, wilson_interval
+
+
+def test_wilson_interval_known_values():
+    low, high = wilson_interval(5, 10, 0.95)
+    assert low == pytest.approx(0.2366, abs=1e-4)
+    assert high == pytest.approx(0.7634, abs=1e-4)
+    low, high = wilson_interval(0, 10, 0.95)
+    assert low == pytest.approx(0.0, abs=1e-12)
+    assert high == pytest.approx(0.2775, abs=1e-4)
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+
+
+def test_running_proportion_weights_and_ratio():
+    running = RunningProportion(0.95).add(3, 1).add(1, 1, weight=2)
+    assert running.images == 2
+    assert (running.successes, running.failures) == (5, 3)
+    low, high = running.interval
+    ratio_low, ratio_high = running.ratio_interval
+    assert ratio_low == pytest.approx(low / (1 - low))
+    assert ratio_high == pytest.approx(high / (1 - high))
+    # No failures at all: the ratio has no upper bound
+    assert math.isinf(RunningProportion().add(4, 0).ratio_interval[1])
+
+
+def test_settled_needs_enough_images_and_a_narrow_interval():
+    running = RunningProportion(0.95)
+    running.add(5000, 5000)
+    assert not running.settled(0.05, min_images=3)
+    running.add(5000, 5000).add(5000, 5000)
+    assert running.settled(0.05, min_images=3)
+    assert not running.settled(0.001, min_images=3)
+
+
+def test_job_stops_once_settled():
+    # One image per chunk, each with 1000 positive and 1000 negative cells:
+    # after 3 images the interval is ~0.025 wide
+    manager = JobManager(max_workers=1)
+    settled = stop_when_settled(lambda output: output, tolerance=0.03, min_images=3)
+    job = manager.submit("early", lambda chunk, errors: [(1000, 1000) for _ in chunk],
+                         list(range(10)), chunk_size=1, stop_when=settled)
+    manager._executor.shutdown(wait=True)
+
+    assert job.status == "done"
+    assert job.stopped_early
+    assert job.completed == 3
@@ -0,0 +1,87 @@
+import numpy as np
+
+from models.tiling import detect_tiled, iter_tiles, nms
+
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeBoxes:
+    def __init__(self, data):
+        self.data = FakeTensor(np.asarray(data, dtype=np.float32).reshape(-1, 6))
+
+    def __len__(self):
+        return len(self.data.array)
+
+
+class FakeResult:
+    def __init__(self, shape, data):
+        self.orig_shape = shape[:2]
+        self.boxes = FakeBoxes(data)
+        self.names = {0: "rbc", 1: "wbc"}
+        self.masks = None
+
+
+class CellModel:
+    # Stands in for a detector: every cell touching a tile is reported,
+    # clipped to the tile like a cell cut off at the tile edge
+    def __init__(self, cells):
+        self.cells = cells
+
+    def predict(self, tiles, verbose=False, **params):
+        results = []
+        for tile in tiles:
+            x, y = tile[0, 0, :2]
+            h, w = tile.shape[:2]
+            data = []
+            for x1, y1, x2, y2, cls in self.cells:
+                box = np.clip([x1 - x, y1 - y, x2 - x, y2 - y], 0, [w, h, w, h])
+                if box[2] > box[0] and box[3] > box[1]:
+                    data.append([*box, 0.9, cls])
+            results.append(FakeResult(tile.shape, data))
+        return results
+
+
+def test_nms_is_class_aware():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [0, 0, 10, 10], [20, 20, 30, 30]],
+                     dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7, 0.6], dtype=np.float32)
+    classes = np.array([0, 0, 1, 0])
+    assert nms(boxes, scores, classes, 0.5).tolist() == [0, 2, 3]
+    assert nms(np.empty((0, 4), np.float32), np.empty(0), np.empty(0, int), 0.5).size == 0
+
+
+def test_tiles_cover_the_image():
+    image = np.zeros((250, 330, 3), dtype=np.uint8)
+    covered = np.zeros(image.shape[:2], dtype=int)
+    for x, y, tile in iter_tiles(image, 100, 20):
+        assert tile.shape[:2] == (100, 100)
+        covered[y:y + 100, x:x + 100] += 1
+    assert (covered >= 1).all()
+
+
+def test_cells_on_tile_edges_are_counted_once():
+    # Pixels hold their own (x, y), so the fake model knows where a tile is
+    ys, xs = np.mgrid[:300, :300]
+    image = np.stack([xs, ys, np.zeros_like(xs)], axis=2)
+    # One cell inside a tile, one across a vertical tile edge, one across a
+    # corner and one touching the image border
+    cells = [(10, 10, 30, 30, 0), (90, 40, 110, 60, 0), (90, 90, 112, 112, 1),
+             (280, 150, 300, 170, 0)]
+    record = detect_tiled(CellModel(cells), image, "smear.png",
+                          {"imgsz": 128, "iou": 0.7}, batch_size=4, overlap=0.25)
+
+    assert len(record) == len(cells)
+    order = np.argsort(record.boxes[:, 0] + record.boxes[:, 1] * 1000)
+    expected = np.array(sorted(cells, key=lambda c: c[0] + c[1] * 1000), dtype=np.float32)
+    np.testing.assert_allclose(record.boxes[order], expected[:, :4])
+    assert record.cls[order].tolist() == expected[:, 4].astype(int).tolist()
+    assert record.image_shape == (300, 300)